@@ -1,6 +1,8 @@
 import numpy as np
 import math
 import scipy.spatial
+import scipy.sparse
+import scipy.sparse.csgraph
 import networkx as nx
 import operator
 
@@ -13,6 +15,9 @@ class Topology:
 		self._topology_specific_parameters = topology_specific_parameters
 		self._PEs_positions = PEs_positions
 
+		# it will be computed the first time it is needed
+		self._distances_between_processing_elements = None
+
 	@property
 	def n_processing_elements(self):
 		
@@ -33,38 +38,35 @@ class Topology:
 	@property
 	def distances_between_processing_elements(self):
 
-		# an empty graph
-		G = nx.Graph()
-
-		# a node per PE is added
-		G.add_nodes_from(range(self._n_processing_elements))
-
-		# this is a list to store tuples defining the edges of the graph
-		edges = []
+		# the neighbours of every PE do not change once the topology is built, and hence the distances are only
+		# computed the first time they are requested
+		if self._distances_between_processing_elements is None:
 
-		# for every PE...
-		for iPE, this_processing_element_neighbours in enumerate(self._neighbours):
+			# a (sparse) adjacency matrix with an entry for every PE and each one of its neighbours...
+			i_processing_elements = np.repeat(
+				np.arange(self._n_processing_elements), [len(neighbours) for neighbours in self._neighbours])
+			i_neighbours = np.concatenate([np.asarray(neighbours, dtype=int) for neighbours in self._neighbours])
 
-			# an edge is added for every one of its neighbours
-			edges.extend([(iPE, n) for n in this_processing_element_neighbours])
+			adjacency = scipy.sparse.csr_matrix(
+				(np.ones(len(i_neighbours)), (i_processing_elements, i_neighbours)),
+				shape=(self._n_processing_elements, self._n_processing_elements))
 
-		# all the edges are added
-		G.add_edges_from(edges)
+			# ...is used to compute the distance (in hops) from each node to every other node (the graph is undirected)
+			distances = scipy.sparse.csgraph.shortest_path(adjacency, directed=False, unweighted=True)
 
-		# paths between nodes
-		paths = nx.all_pairs_shortest_path(G)
+			# if the topology is not connected, some PEs cannot be reached from others (their distance is infinity)
+			if np.isinf(distances).any():
 
-		# a numpy array in which each row yields the distance (in hops) from each node to every other node
-		distances = np.empty((self._n_processing_elements, self._n_processing_elements), dtype=int)
+				raise Exception('the topology is not connected: some PEs cannot be reached from others')
 
-		for iPE in range(self._n_processing_elements):
+			distances = distances.astype(int)
 
-			for iNeigh in range(self._n_processing_elements):
+			# the cached array is shared by every caller, and hence it must not be modified
+			distances.flags.writeable = False
 
-				# the number of hops is the number of nodes in the path minus one
-				distances[iPE, iNeigh] = len(paths[iPE][iNeigh])-1
+			self._distances_between_processing_elements = distances
 
-		return distances
+		return self._distances_between_processing_elements
 
 	def i_neighbours_within_hops(self, n_hops, lower_bound=0):
 
@@ -163,7 +165,14 @@ class ConstantDegreeSimpleGraph(Topology):
 		# the Havel-Hakimi algorithm is used to obtain a simple graph with the requested degrees
 		graph = nx.havel_hakimi_graph([n_neighbours]*n_processing_elements)
 		
-		self._neighbours = [graph.neighbors(i) for i in range(n_processing_elements)]
+		# the lists of neighbours are filled in a single pass over the edges (rather than calling "neighbors" for every
+		# node, which in networkx >= 2.0 returns an iterator that can only be consumed once)
+		self._neighbours = [[] for _ in range(n_processing_elements)]
+
+		for i, j in graph.edges():
+
+			self._neighbours[i].append(j)
+			self._neighbours[j].append(i)
 
 
 class FullyConnected(Topology):
@@ -30,6 +30,7 @@ simulation_modules = [simulations.drna, simulations.mposterior, simulations.npmc
 
 import utils.file
 import smc_tools.resampling
+import smc.resampling
 
 # keys used to identify the different pseudo random numbers generators
 # (they must coincide with those in the parameters file...)
@@ -262,13 +263,37 @@ transitionKernel = getattr(state, settings_transition_kernel['implementing class
 
 # ------------------------------------------------ SMC stuff -----------------------------------------------------------
 
+# the classes implementing the available resampling algorithms...
+resampling_algorithms_classes = {
+	"multinomial": smc_tools.resampling.MultinomialResamplingAlgorithm,
+	"systematic": smc.resampling.SystematicResamplingAlgorithm,
+	"stratified": smc.resampling.StratifiedResamplingAlgorithm
+}
+
+# ...and criteria (the latter require different parameters, and hence they are built through functions)
+resampling_criteria_builders = {
+	"always": lambda: smc_tools.resampling.AlwaysResamplingCriterion(),
+	"effective sample size": lambda: smc.resampling.LogEffectiveSampleSizeResamplingCriterion(
+		parameters["SMC"]["resampling ratio"])
+}
+
+settings_resampling_algorithm = parameters["SMC"].get("resampling algorithm", "multinomial")
+settings_resampling_criterion = parameters["SMC"].get("resampling criterion", "always")
+
+if settings_resampling_algorithm not in resampling_algorithms_classes:
+
+	raise Exception("don't know about resampling algorithm \"{}\"".format(settings_resampling_algorithm))
+
+if settings_resampling_criterion not in resampling_criteria_builders:
+
+	raise Exception("don't know about resampling criterion \"{}\"".format(settings_resampling_criterion))
+
 # a resampling algorithm...
-resampling_algorithm = smc_tools.resampling.MultinomialResamplingAlgorithm(
+resampling_algorithm = resampling_algorithms_classes[settings_resampling_algorithm](
 	PRNGs["Sensors and Monte Carlo pseudo random numbers generator"])
 
 # ...and a resampling criterion are needed for the particle filters
-# resampling_criterion = smc_tools.resampling.EffectiveSampleSizeBasedResamplingCriterion(parameters["SMC"]["resampling ratio"])
-resampling_criterion = smc_tools.resampling.AlwaysResamplingCriterion()
+resampling_criterion = resampling_criteria_builders[settings_resampling_criterion]()
 
 # -------------------------------------------------- other stuff  ------------------------------------------------------
 
@@ -336,6 +361,9 @@ for iFrame in range(parameters["number of frames"]):
 # data is saved...
 sim.save_data(target_position)
 
+# ...any resource held by the simulation (e.g., thread pools) released...
+sim.close()
+
 # ...and also the parameters (in a different file)
 save_parameters()
 
@@ -12,19 +12,22 @@ def error_fit(Ms, f_Ms, K, step=0.01, n_iter=1000000):
 	
 	# initial values for c,z
 	c, z = np.random.rand(2)
+
+	# these don't change across iterations
+	sqrt_K = np.sqrt(K)
+	log_Ms = np.log(Ms)
 	
 	for i in range(n_iter):
 
 		# so that computations are reused
-		Ms_to_the_z = Ms**z
-		Ms_to_the_z_times_sqrt_K = Ms_to_the_z*np.sqrt(K)
-		error = f_Ms - c/Ms_to_the_z_times_sqrt_K
+		inv_Ms_to_the_z_times_sqrt_K = 1/(Ms**z*sqrt_K)
+		twice_the_error = 2*(f_Ms - c*inv_Ms_to_the_z_times_sqrt_K)
 		
 		# derivative respect to c
-		grad_c = np.sum(2 * error * (-1/Ms_to_the_z_times_sqrt_K))
+		grad_c = -np.sum(twice_the_error * inv_Ms_to_the_z_times_sqrt_K)
 		
 		# derivative respect to z
-		grad_z = np.sum(2* error * c/np.sqrt(K)*np.log(Ms)*(1/Ms_to_the_z))
+		grad_z = c*np.sum(twice_the_error * log_Ms * inv_Ms_to_the_z_times_sqrt_K)
 		
 		c -= step*grad_c
 		z -= step*grad_z
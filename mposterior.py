@@ -3,37 +3,58 @@ import numpy as np
 
 def log_rbf_kernel_matrix(x, y, sigma):
 
-	norms_x = np.sum(x**2, axis=1)
-	norms_y = np.sum(y**2, axis=1)
+	# the squared norms of the rows are computed in a single pass (no squared copies of "x" and "y")
+	norms_x = np.einsum('ij,ij->i', x, x)
+	norms_y = np.einsum('ij,ij->i', y, y)
 
-	return -sigma*(norms_x[:, np.newaxis] + norms_y[np.newaxis, :] - 2*x.dot(y.T))
+	# the squared distances between every row of "x" and every row of "y" are assembled in place on top of the matrix
+	# of inner products...
+	res = x.dot(y.T)
+	res *= -2
+	res += norms_x[:, np.newaxis]
+	res += norms_y[np.newaxis, :]
+
+	# ...and so is the scaling
+	res *= -sigma
+
+	return res
 
 
 def find_weiszfeld_median(subset_atoms, sigma, maxit, tol, small_number=1e-6):
 
 	n_subsets = len(subset_atoms)
 
-	n_atoms = np.empty(n_subsets, dtype=int)
-	kernel_plus_weights_subset = [None]*n_subsets
-	subset_probs = [None]*n_subsets
+	n_atoms = np.array([len(this_subset_atoms) for this_subset_atoms in subset_atoms], dtype=int)
 	old_norms = np.zeros(n_subsets)
 
-	for i, this_subset_atoms in enumerate(subset_atoms):
-
-		n_atoms[i] = len(this_subset_atoms)
-		subset_probs[i] = np.full((n_atoms[i], 1), 1.0/n_atoms[i])
-
-		# all these are matrices
-		kernel_matrix_subset = log_rbf_kernel_matrix(this_subset_atoms, this_subset_atoms, sigma)
-		weights_subset = np.log(np.outer(subset_probs[i], subset_probs[i]))
-		kernel_plus_weights_subset[i] = kernel_matrix_subset + weights_subset
+	# the atoms of every subset are uniformly weighted, and hence the logarithm of their probability is a scalar
+	log_subset_probs = -np.log(n_atoms)
 
 	median_empirical_measure_atoms = np.vstack(subset_atoms)
 	median_empirical_measure_probs = np.repeat(1/(n_subsets*n_atoms), n_atoms)[:, np.newaxis]
 
-	# distances between atoms for the median posterior
+	# distances between atoms for the median posterior (it doesn't change across iterations)
 	kernel_matrix_median = log_rbf_kernel_matrix(median_empirical_measure_atoms, median_empirical_measure_atoms, sigma)
 
+	# since the atoms of the median are those of all the subsets one after another, the kernel matrices between the
+	# atoms of a subset and those of the median, and between the atoms of a subset, are blocks of the above one
+	i_first_atoms = np.concatenate(([0], np.cumsum(n_atoms)))
+
+	kernel_matrix_subset_median = [
+		kernel_matrix_median[i_first:i_last] for i_first, i_last in zip(i_first_atoms[:-1], i_first_atoms[1:])]
+
+	kernel_plus_weights_subset = [
+		kernel_matrix_median[i_first:i_last, i_first:i_last] + 2 * log_probs
+		for i_first, i_last, log_probs in zip(i_first_atoms[:-1], i_first_atoms[1:], log_subset_probs)]
+
+	# the latter don't change across iterations either, and neither do their maxima and (shifted) sums of exponentials
+	max_kernel_plus_weights_subset = np.array([k.max() for k in kernel_plus_weights_subset])
+	sum_exp_kernel_plus_weights_subset = np.array([
+		np.exp(k - m).sum() for k, m in zip(kernel_plus_weights_subset, max_kernel_plus_weights_subset)])
+
+	# a buffer for the kernel matrix of the median plus the weights (overwritten by their shifted exponentials)
+	kernel_plus_weights_median = np.empty_like(kernel_matrix_median)
+
 	for jj in range(maxit):
 
 		# if jj % 10 == 0:
@@ -41,28 +62,35 @@ def find_weiszfeld_median(subset_atoms, sigma, maxit, tol, small_number=1e-6):
 		# 	print('Weiszfeld iteration {}'.format(jj+1))
 
 		# --------------------------------
-		weights_median = np.log(np.outer(median_empirical_measure_probs, median_empirical_measure_probs))
-		kernel_plus_weights_median = kernel_matrix_median + weights_median
+		log_median_probs = np.log(median_empirical_measure_probs).ravel()
 
-		norms = np.zeros(n_subsets)
+		# the logarithm of the outer product of the probabilities is the "outer sum" of their logarithms
+		np.add(kernel_matrix_median, log_median_probs[:, np.newaxis], out=kernel_plus_weights_median)
+		kernel_plus_weights_median += log_median_probs[np.newaxis, :]
+
+		# the (shifted) sum of the exponentials of the above only needs to be computed once per iteration
+		max_kernel_plus_weights_median = kernel_plus_weights_median.max()
+		kernel_plus_weights_median -= max_kernel_plus_weights_median
+		sum_exp_kernel_plus_weights_median = np.exp(kernel_plus_weights_median, out=kernel_plus_weights_median).sum()
 
-		for i, (this_subset_atoms, this_subset_probs, this_subset_kernel_plus_weights) in enumerate(zip(
-				subset_atoms, subset_probs, kernel_plus_weights_subset)):
+		norms = np.zeros(n_subsets)
 
-			kernel_matrix_subset_median = log_rbf_kernel_matrix(this_subset_atoms, median_empirical_measure_atoms, sigma)
-			weights_subset_median = np.log(np.outer(this_subset_probs, median_empirical_measure_probs))
+		for i, (max_this_subset, sum_exp_this_subset, this_kernel_matrix_subset_median, log_probs) in enumerate(zip(
+				max_kernel_plus_weights_subset, sum_exp_kernel_plus_weights_subset, kernel_matrix_subset_median,
+				log_subset_probs)):
 
-			kernel_plus_weights_subset_median = kernel_matrix_subset_median + weights_subset_median
+			kernel_plus_weights_subset_median = this_kernel_matrix_subset_median + (
+				log_probs + log_median_probs)[np.newaxis, :]
 
 			# in order to avoid very small numbers
 			max_exponent = max(
-				this_subset_kernel_plus_weights.max(),
-				kernel_plus_weights_median.max(),
+				max_this_subset,
+				max_kernel_plus_weights_median,
 				kernel_plus_weights_subset_median.max())
 
 			norms[i] = np.exp(max_exponent) * (
-				np.exp(this_subset_kernel_plus_weights - max_exponent).sum() +
-				np.exp(kernel_plus_weights_median - max_exponent).sum() -
+				np.exp(max_this_subset - max_exponent) * sum_exp_this_subset +
+				np.exp(max_kernel_plus_weights_median - max_exponent) * sum_exp_kernel_plus_weights_median -
 				2 * np.exp(kernel_plus_weights_subset_median - max_exponent).sum())
 
 			if norms[i] < small_number:
@@ -89,4 +117,6 @@ def find_weiszfeld_median(subset_atoms, sigma, maxit, tol, small_number=1e-6):
 	#
 	# 	histWts = histWts[:, :jj]
 
+	# the transpose of the (C-contiguous) stacked atoms is a Fortran-ordered view, and hence every atom (column) is
+	# contiguous in memory when they are later gathered (resampled) without an extra copy
 	return median_empirical_measure_atoms.T, median_empirical_measure_probs
@@ -1,9 +1,55 @@
 import math
+import functools
 
 import numpy as np
 import scipy.cluster.vq
 
 
+@functools.lru_cache(maxsize=32)
+def _equispaced_positions(bottom_left_corner, top_right_corner, n):
+	
+	bottom_left_corner = np.array(bottom_left_corner)
+
+	# a vector representing the diagonal of the rectangle...
+	diagonal = np.array(top_right_corner) - bottom_left_corner
+	
+	# ...from which we compute the area
+	area = diagonal.prod()
+	
+	# if the positions are equispaced, each one should "cover" an area equal to
+	area_per_sensor = area/n
+	
+	# if the area "covered" by each sensor is a square, then its side is
+	square_side = math.sqrt(area_per_sensor)
+	
+	# number of "full" squares that fit in each dimension
+	n_squares_x_dim, n_squares_y_dim = np.floor(diagonal[0]/square_side), np.floor(diagonal[1]/square_side)
+	
+	# if by adding one position in each dimension...
+	n_overfitting_sensors = (n_squares_x_dim+1)*(n_squares_y_dim+1)
+	
+	# ...we get closer to the number of requested sensors...
+	if (n-(n_squares_x_dim*n_squares_y_dim)) > (n_overfitting_sensors-n):
+		
+		# ...we repeat the computations with the "overfitting" number of sensors
+		area_per_sensor = area/n_overfitting_sensors
+		
+		square_side = math.sqrt(area_per_sensor)
+		n_squares_x_dim, n_squares_y_dim = np.floor(diagonal[0]/square_side), np.floor(diagonal[1]/square_side)
+	
+	# in each dimension there is a certain length that is not covered (using % "weird" things happen sometimes...)
+	remaining_x_dim = diagonal[0] - n_squares_x_dim*square_side
+	remaining_y_dim = diagonal[1] - n_squares_y_dim*square_side
+	
+	# the x coordinate changes with the "outer" index and the y coordinate with the "inner" one
+	x = bottom_left_corner[0] + (remaining_x_dim + square_side) / 2 + np.arange(int(n_squares_x_dim)) * square_side
+	y = bottom_left_corner[1] + (remaining_y_dim + square_side) / 2 + np.arange(int(n_squares_y_dim)) * square_side
+
+	res = np.vstack((np.repeat(x, len(y)), np.tile(y, len(x))))
+
+	return res
+
+
 class Network:
 	
 	def __init__(self, bottom_left_corner, top_right_corner, n_PEs, n_sensors):
@@ -64,48 +110,12 @@ class Network:
 		return positions
 
 	def equispaced_positions(self, n):
-		
-		# a vector representing the diagonal of the rectangle...
-		diagonal = self._top_right_corner - self._bottom_left_corner
-		
-		# ...from which we compute the area
-		area = diagonal.prod()
-		
-		# if the positions are equispaced, each one should "cover" an area equal to
-		area_per_sensor = area/n
-		
-		# if the area "covered" by each sensor is a square, then its side is
-		square_side = math.sqrt(area_per_sensor)
-		
-		# number of "full" squares that fit in each dimension
-		n_squares_x_dim, n_squares_y_dim = np.floor(diagonal[0]/square_side), np.floor(diagonal[1]/square_side)
-		
-		# if by adding one position in each dimension...
-		n_overfitting_sensors = (n_squares_x_dim+1)*(n_squares_y_dim+1)
-		
-		# ...we get closer to the number of requested sensors...
-		if (n-(n_squares_x_dim*n_squares_y_dim)) > (n_overfitting_sensors-n):
-			
-			# ...we repeat the computations with the "overfitting" number of sensors
-			area_per_sensor = area/n_overfitting_sensors
-			
-			square_side = math.sqrt(area_per_sensor)
-			n_squares_x_dim, n_squares_y_dim = np.floor(diagonal[0]/square_side), np.floor(diagonal[1]/square_side)
-		
-		# in each dimension there is a certain length that is not covered (using % "weird" things happen sometimes...)
-		remaining_x_dim = diagonal[0] - n_squares_x_dim*square_side
-		remaining_y_dim = diagonal[1] - n_squares_y_dim*square_side
-		
-		res = np.transpose(
-				np.array(
-					[
-						[
-							self._bottom_left_corner[0] + (remaining_x_dim + square_side) / 2 + i * square_side,
-							self._bottom_left_corner[1] + (remaining_y_dim + square_side) / 2 + j * square_side
-						] for i in range(int(n_squares_x_dim)) for j in range(int(n_squares_y_dim))
-					]))
-
-		return res
+
+		# the positions only depend on the corners of the room and the number of them, and hence they are cached (a copy
+		# is returned so that the cached array is never modified)
+		return _equispaced_positions(
+			tuple(np.asarray(self._bottom_left_corner).tolist()), tuple(np.asarray(self._top_right_corner).tolist()), n
+		).copy()
 
 	@property
 	def PEs_positions(self):
@@ -1,9 +1,73 @@
+import time
+import os
+import functools
+
 import numpy as np
 import matplotlib
+
+# if requested, the non-interactive "Agg" backend is used (no GUI is ever initialized)
+if os.environ.get('DPF_HEADLESS'):
+	matplotlib.use('Agg')
+
+import matplotlib.collections
+import matplotlib.figure
+import matplotlib.backends.backend_agg
 import matplotlib.pyplot as plt
 
+# parameters loaded from ".parameters" files, indexed by path
+_parameters_cache = {}
+
+
+def load_parameters(filename):
+
+	import pickle
+
+	parameters_file = os.path.splitext(filename)[0] + '.parameters'
+
+	# the same file is usually loaded again and again (e.g., when plotting several trajectories)
+	if parameters_file not in _parameters_cache:
+
+		with open(parameters_file, "rb") as f:
+
+			# ...is loaded
+			_parameters_cache[parameters_file] = pickle.load(f)[0]
+
+	return _parameters_cache[parameters_file]
+
+
+@functools.lru_cache(maxsize=8)
+def time_axis(n_time_instants):
+
+	"""The time instants 0, 1, ..., n_time_instants-1 (the same read-only array is returned for a given length).
+
+	Parameters
+	----------
+	n_time_instants : int
+		The number of time instants.
+
+	Returns
+	-------
+	t : ndarray
+		The (read-only) time axis.
 
-def setup_axes(figure_id, clear_figure=True):
+	"""
+
+	t = np.arange(n_time_instants)
+	t.flags.writeable = False
+
+	return t
+
+
+def setup_axes(figure_id, clear_figure=True, interactive=True):
+
+	# if the figure is only going to be saved to a file...
+	if not interactive:
+
+		# ...it is created outside "pyplot" and attached to an "Agg" canvas (neither a window nor a GUI event loop)
+		fig = matplotlib.figure.Figure()
+		matplotlib.backends.backend_agg.FigureCanvasAgg(fig)
+
+		return fig.add_subplot(111), fig
 	
 	# interactive mode on
 	plt.ion()
@@ -63,7 +127,7 @@ def distributed_against_centralized_particle_filter(
 	
 	if output_file:
 	
-		plt.savefig(output_file)
+		fig.savefig(output_file)
 	
 	return ax, fig
 
@@ -140,7 +204,7 @@ def particle_filters(
 	
 	if output_file:
 	
-		plt.savefig(output_file)
+		fig.savefig(output_file)
 	
 	return ax, fig
 
@@ -148,28 +212,28 @@ def particle_filters(
 def aggregated_weights_distribution_vs_time(
 		aggregated_weights, output_file='aggregatedWeightsVsTime.pdf', xticks_step=10):
 
-	# the corresponding axes are created
-	ax, _ = setup_axes('Aggregated Weights Evolution')
+	# the corresponding axes are created (the figure is only saved)
+	ax, fig = setup_axes('Aggregated Weights Evolution', interactive=False)
 	
 	# the shape of the array with the aggregated weights is used to figure out the number of PEs and time instants
 	n_time_instants, n_processing_elements = aggregated_weights.shape
 
 	# the aggregated weights are represented normalized
-	normalized_aggregated_weights = np.divide(aggregated_weights, aggregated_weights.sum(axis=1)[np.newaxis].T)
+	normalized_aggregated_weights = aggregated_weights / aggregated_weights.sum(axis=1, keepdims=True)
 
-	# in order to keep tabs on the sum of the aggregated weights already represented at each time instant
-	accum = np.zeros(n_time_instants)
+	# at each time instant, the bar of every PE starts where that of the previous one ends
+	bottoms = np.cumsum(normalized_aggregated_weights, axis=1) - normalized_aggregated_weights
 
 	# positions for the bars corresponding to the different time instants
-	t = range(n_time_instants)
+	t = time_axis(n_time_instants)
 
-	# the colors associated to the different PEs are generated randomly
-	processing_elements_colors = np.random.rand(n_processing_elements, 3)
+	# the colors associated to the different PEs are generated randomly (always the same for a given number of PEs)
+	processing_elements_colors = np.random.RandomState(0).rand(n_processing_elements, 3)
 
-	for i in range(n_processing_elements):
-		
-		ax.bar(t, normalized_aggregated_weights[:, i], bottom=accum, color=processing_elements_colors[i, :])
-		accum += normalized_aggregated_weights[:, i]
+	# all the bars (one per time instant and PE) are drawn at once
+	ax.bar(
+		np.repeat(t, n_processing_elements), normalized_aggregated_weights.ravel(), bottom=bottoms.ravel(),
+		color=np.tile(processing_elements_colors, (n_time_instants, 1)))
 	
 	ax.set_xticks(np.arange(0.5, n_time_instants, xticks_step))
 	ax.set_xticklabels(range(0, n_time_instants, xticks_step))
@@ -178,7 +242,7 @@ def aggregated_weights_distribution_vs_time(
 	ax.set_yticks([0, 0.5, 1])
 	ax.set_ybound(upper=1)
 
-	plt.savefig(output_file)
+	fig.savefig(output_file)
 
 
 def aggregated_weights_supremum_vs_time(
@@ -196,11 +260,11 @@ def aggregated_weights_supremum_vs_time(
 	ax, fig = setup_axes(figure_id)
 	
 	# for the x-axis
-	t = np.arange(n_time_instants)
+	t = time_axis(n_time_instants)
 
 	if plot_everything:
-		# this is plotted along time
-		ax.plot(t, max_weights[t], **supremum_line_properties)
+		# this is plotted along time (every time instant, hence no indexing is needed)
+		ax.plot(t, max_weights, **supremum_line_properties)
 	
 	# the time instants at which step exchanges occur...
 	t_exchange_steps = np.arange(step_exchange_period-1, n_time_instants, step_exchange_period)
@@ -225,7 +289,7 @@ def aggregated_weights_supremum_vs_time(
 	
 	if output_file:
 
-		plt.savefig(output_file)
+		fig.savefig(output_file)
 	
 	return ax, fig
 
@@ -266,7 +330,7 @@ def aggregated_weights_supremum_vs_n_processing_elements(
 
 	if output_file:
 
-		plt.savefig(output_file)
+		fig.savefig(output_file)
 	
 	return ax, fig
 
@@ -274,17 +338,12 @@ def aggregated_weights_supremum_vs_n_processing_elements(
 def trajectory(filename, i_trajectory=0, n_time_instants=-1, ticks_font_size=12):
 	
 	import network_nodes
-	import pickle
-	import os
 	import scipy.io
 	
 	position = scipy.io.loadmat(filename)['targetPosition'][..., i_trajectory]
 	
 	# parameters are loaded
-	with open(os.path.splitext(filename)[0] + '.parameters', "rb") as f:
-		
-		# ...is loaded
-		parameters = pickle.load(f)[0]
+	parameters = load_parameters(filename)
 
 	n_processing_elements = parameters['topologies'][parameters['topologies']['type'][0]]['number of PEs']
 	n_sensors = parameters['sensors']['number']
@@ -319,8 +378,6 @@ def trajectory(filename, i_trajectory=0, n_time_instants=-1, ticks_font_size=12)
 
 def trajectory_from_hdf5(filename, i_trajectory=0, n_time_instants=-1, ticks_font_size=12):
 
-	import pickle
-	import os
 	import h5py
 
 	import simulations.mposterior
@@ -329,10 +386,7 @@ def trajectory_from_hdf5(filename, i_trajectory=0, n_time_instants=-1, ticks_fon
 	position = simulations.mposterior.Mposterior.parse_hdf5(data_file)[0][..., i_trajectory]
 
 	# parameters are loaded
-	with open(os.path.splitext(filename)[0] + '.parameters', "rb") as f:
-
-		# ...is loaded
-		parameters = pickle.load(f)[0]
+	parameters = load_parameters(filename)
 
 	if isinstance(parameters['topologies types'], list):
 
@@ -388,17 +442,25 @@ class RoomPainter:
 		self._sensors_positions = sensors_positions
 		self._sleep_time = sleep_time
 		
-		# in order to draw a segment from the previous position to the current one, we need to remember the former
-		self._previous_position = None
-		
-		# the same for the estimates, but since there can be more than one, we use a dictionary
-		self._previous_estimates = {}
+		# the trajectory of the target is kept in a single line whose data grows with every update...
+		self._target_xs, self._target_ys = [], []
+		self._target_line = None
+
+		# ...and the same for the estimates, but since there can be more than one, we use dictionaries
+		self._estimates_xs, self._estimates_ys = {}, {}
+		self._estimates_lines = {}
 		
 		# used to erase the previous particles and paint the new ones
 		self._particles = {}
 		
 		# in order to avoid a legend entry per plotted segment
 		self._legend_entries = []
+
+		# the artists that change from one update to the next (the rest are part of the background)
+		self._dynamic_artists = []
+
+		# the (static) background of the axes, to be restored before blitting the dynamic artists
+		self._background = None
 		
 		# a new pair of axes is set up
 		self._ax, self._figure = setup_axes('Room', clear_figure=False)
@@ -412,70 +474,100 @@ class RoomPainter:
 		
 		# show...now!
 		self._figure.show()
+
+	def blit(self):
+
+		# the first time, the figure is fully drawn (including whatever subclasses added during "setup") and the
+		# background saved
+		if self._background is None:
+
+			self._figure.canvas.draw()
+			self._background = self._figure.canvas.copy_from_bbox(self._ax.bbox)
+
+		# the background is restored...
+		self._figure.canvas.restore_region(self._background)
+
+		# ...and only the dynamic artists are drawn on top of it
+		for artist in self._dynamic_artists:
+
+			self._ax.draw_artist(artist)
+
+		self._figure.canvas.blit(self._ax.bbox)
 		
 	def updateTargetPosition(self,position):
 		
-		# if this is not the first update (i.e., there exists a previous position)...
-		if self._previous_position is not None:
-			# ...plot the step taken
-			self._ax.plot(
-				np.array([self._previous_position[0], position[0]]),
-				np.array([self._previous_position[1], position[1]]), linestyle='-', color='red')
 		# if this is the first update...
-		else:
-			# ...just plot the position keeping the handler...
+		if self._target_line is None:
+
+			# ...plot the position keeping the handler...
 			p, = self._ax.plot(position[0],position[1],color='red',marker='d',markersize=10)
 			
 			# we add this to the list of entries in the legend (just once!!)
 			self._legend_entries.append(p)
-		
-		self._previous_position = position
+
+			# ...and the line that will be extended with every step taken
+			self._target_line, = self._ax.plot([], [], linestyle='-', color='red')
+
+			self._dynamic_artists.extend([p, self._target_line])
+
+		self._target_xs.append(position[0])
+		self._target_ys.append(position[1])
+
+		self._target_line.set_data(self._target_xs, self._target_ys)
 		
 		# plot now...
-		self._figure.canvas.draw()
+		self.blit()
 
-		# ...and wait...
-		plt.pause(self._sleep_time)
+		# ...process any pending GUI events...
+		self._figure.canvas.flush_events()
+
+		# ...and wait (if requested)
+		if self._sleep_time > 0:
+
+			time.sleep(self._sleep_time)
 	
 	def updateEstimatedPosition(self,position,identifier='unnamed',color='blue'):
 		
-		# if this is not the first update (i.e., there exists a previous estimate)...
-		if identifier in self._previous_estimates:
-			# ...plot the step taken
-			self._ax.plot(
-				np.array([self._previous_estimates[identifier][0], position[0]]),
-				np.array([self._previous_estimates[identifier][1], position[1]]),linestyle='-', color=color)
 		# if this is the first update...
-		else:
-			# ...just plot the position keeping the handler...
-			p, = self._ax.plot(position[0],position[1],color=color)
+		if identifier not in self._estimates_lines:
+
+			# ...a line is created keeping the handler...
+			self._estimates_lines[identifier], = self._ax.plot([], [], linestyle='-', color=color)
+			self._estimates_xs[identifier], self._estimates_ys[identifier] = [], []
 			
 			# ...to add it to the legend
-			self._legend_entries.append(p)
-		
-		self._previous_estimates[identifier] = position
+			self._legend_entries.append(self._estimates_lines[identifier])
+
+			self._dynamic_artists.append(self._estimates_lines[identifier])
+
+		self._estimates_xs[identifier].append(position[0])
+		self._estimates_ys[identifier].append(position[1])
+
+		self._estimates_lines[identifier].set_data(self._estimates_xs[identifier], self._estimates_ys[identifier])
 		
 		# plot now...
-		self._figure.canvas.draw()
+		self.blit()
 
 	def updateParticlesPositions(self,positions,identifier='unnamed',color='blue'):
 
-		# if previous particles are being displayed...
-		if identifier in self._particles:
-			# ...we erase them
-			self._ax.lines.remove(self._particles[identifier])
+		# if no particles have been displayed yet for this identifier...
+		if identifier not in self._particles:
+			# ...a line (without a line) is created for them
+			self._particles[identifier], = self._ax.plot([],[],color=color,marker='o',linewidth=0)
+			self._dynamic_artists.append(self._particles[identifier])
 
-		self._particles[identifier], = self._ax.plot(positions[0,:],positions[1,:],color=color,marker='o',linewidth=0)
+		# the previous particles are replaced with the new ones
+		self._particles[identifier].set_data(positions[0,:],positions[1,:])
 		
 		# plot now...
-		self._figure.canvas.draw()
+		self.blit()
 		
 	def save(self, outputFile='trajectory.pdf'):
 		
 		# just in case...the current figure is set to the proper value
 		plt.figure(self._figure.number)
 		
-		self._ax.legend(self._legend_entries, ['real'] + list(self._previous_estimates.keys()), ncol=3)
+		self._ax.legend(self._legend_entries, ['real'] + list(self._estimates_lines.keys()), ncol=3)
 		
 		plt.savefig(outputFile)
 		
@@ -566,16 +658,25 @@ class TightRectangularRoomPainterWithPEs(TightRectangularRoomPainter):
 			
 			self._ax.annotate('#{}'.format(iPE),xy=tuple(pos))
 		
-		# in "self._connections", for every PE there is a list of sensors associated
-		for iPE,sensorsIndexes in enumerate(self._connections):
-			
-			# for every sensor associated with the PE being processed
-			for iSensor in sensorsIndexes:
-			
-				self._ax.plot([self._sensors_positions[0, iSensor], self._PEsPositions[0, iPE]], [self._sensors_positions[1, iSensor], self._PEsPositions[1, iPE]], linewidth=2, linestyle='--')
-				
-		for iPE,iNeighbours in enumerate(self._PEsPEsConnections):
-			
-			for i in iNeighbours:
-				
-				self._ax.plot([self._PEsPositions[0,iPE],self._PEsPositions[0,i]],[self._PEsPositions[1,iPE],self._PEsPositions[1,i]],linewidth=1,linestyle=':',color='gray')
\ No newline at end of file
+		# in "self._connections", for every PE there is a list of sensors associated, and every PE appears as many
+		# times as sensors it is connected to
+		i_PEs = np.repeat(np.arange(len(self._connections)), [len(sensors) for sensors in self._connections])
+		i_sensors = np.concatenate([np.asarray(sensors, dtype=int) for sensors in self._connections])
+
+		# every segment, joining a sensor and a PE, is given by a (2, 2) array (one point per row)...
+		sensors_PEs_segments = np.stack(
+			(self._sensors_positions[:, i_sensors].T, self._PEsPositions[:, i_PEs].T), axis=1)
+
+		# ...and all of them are drawn at once (the colors in the cycle of the axes are used in turn)
+		self._ax.add_collection(matplotlib.collections.LineCollection(
+			sensors_PEs_segments, linewidths=2, linestyles='--',
+			colors=plt.rcParams['axes.prop_cycle'].by_key()['color']))
+
+		# the same for the connections among the PEs
+		i_PEs = np.repeat(np.arange(len(self._PEsPEsConnections)), [len(n) for n in self._PEsPEsConnections])
+		i_neighbours = np.concatenate([np.asarray(n, dtype=int) for n in self._PEsPEsConnections])
+
+		PEs_PEs_segments = np.stack((self._PEsPositions[:, i_PEs].T, self._PEsPositions[:, i_neighbours].T), axis=1)
+
+		self._ax.add_collection(matplotlib.collections.LineCollection(
+			PEs_PEs_segments, linewidths=1, linestyles=':', colors='gray'))
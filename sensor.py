@@ -1,17 +1,83 @@
 import abc
 
 import numpy as np
-import scipy.stats
 
 import smc_tools.util
 
+# normalization constant of the standard Gaussian pdf
+_INV_SQRT_2PI = 1. / np.sqrt(2 * np.pi)
+
+
+def inverse_path_loss_function(path_loss_exponent):
+
+	"""Returns a function computing "distances ** (-path_loss_exponent)" from the squared distances.
+
+	The most common (integer) path loss exponents get specialized functions that avoid the (expensive) general power.
+
+	Parameters
+	----------
+	path_loss_exponent: float
+		the path loss exponent
+
+	Returns
+	-------
+	function: callable
+		A function that receives (an array of) squared distances.
+	"""
+
+	if path_loss_exponent == 2:
+
+		return np.reciprocal
+
+	elif path_loss_exponent == 3:
+
+		return lambda squared_distances: np.reciprocal(squared_distances * np.sqrt(squared_distances))
+
+	elif path_loss_exponent == 4:
+
+		return lambda squared_distances: np.reciprocal(squared_distances * squared_distances)
+
+	else:
+
+		minus_half_path_loss_exponent = -path_loss_exponent / 2
+
+		return lambda squared_distances: squared_distances ** minus_half_path_loss_exponent
+
+
+def sensors_squared_distances(sensors_positions, positions):
+
+	"""Computes the squared distances between every sensor and every position, one coordinate at a time.
+
+	Parameters
+	----------
+	sensors_positions: numpy array
+		the positions of the sensors (one per column)
+	positions: numpy array
+		the positions (e.g., those of the particles) to be compared with the former (one per column)
+
+	Returns
+	-------
+	squared_distances: numpy array
+		Every row corresponds to a sensor, and every column to a position.
+	"""
+
+	# the differences along the first coordinate are squared in place...
+	res = np.subtract(positions[0], sensors_positions[0][:, np.newaxis])
+	np.square(res, out=res)
+
+	# ...and those along the second one are added (no array with the differences along both coordinates is needed)
+	aux = np.subtract(positions[1], sensors_positions[1][:, np.newaxis])
+	res += np.square(aux, out=aux)
+
+	return res
+
 
 class Sensor(metaclass=abc.ABCMeta):
 
 	def __init__(self, position, pseudo_random_numbers_generator):
 
-		# position is saved for later use
-		self.position = position
+		# position is saved for later use (as a contiguous column vector so that it broadcasts against many positions)
+		self.position = np.ascontiguousarray(position, dtype=np.float64).reshape(2, 1)
 
 		# pseudo random numbers generator
 		self._pseudo_random_numbers_generator = pseudo_random_numbers_generator
@@ -22,7 +88,7 @@ class Sensor(metaclass=abc.ABCMeta):
 		pass
 
 	@abc.abstractmethod
-	def likelihood(self, observation, positions):
+	def likelihood(self, observation, positions, out=None):
 
 		""" It computes the likelihoods of several positions.
 		
@@ -32,6 +98,8 @@ class Sensor(metaclass=abc.ABCMeta):
 			the observation whose probability is computed
 		positions: numpy array
 			positions of several particles
+		out: numpy array, optional
+			array (with as many elements as positions) in which the result is stored
 		"""
 		pass
 
@@ -44,9 +112,12 @@ class BinarySensor(Sensor):
 
 		super().__init__(position, pseudo_random_numbers_generator)
 
-		# the distance within reach of the sensor
+		# the distance within reach of the sensor...
 		self._threshold = radius
 
+		# ...and its square (comparing squared distances against it avoids computing square roots)
+		self._squared_threshold = radius**2
+
 		# the probability of (correct) detection
 		self._prob_detection = probability_of_detection_within_the_radius
 
@@ -64,29 +135,34 @@ class BinarySensor(Sensor):
 
 	def detect(self, target_pos):
 
-		distance = np.linalg.norm((self.position - target_pos))
+		# the position of the target is a (2, 1) array, and hence the squared distance can be computed "by hand"
+		dx = self.position[0, 0] - target_pos[0, 0]
+		dy = self.position[1, 0] - target_pos[1, 0]
 
-		if distance < self._threshold:
+		if dx*dx + dy*dy < self._squared_threshold:
 			return self._pseudo_random_numbers_generator.rand() < self._prob_detection
 		else:
 			return self._pseudo_random_numbers_generator.rand() < self._prob_false_alarm
 
-	def likelihood(self, observation, positions):
+	def likelihood(self, observation, positions, out=None):
+
+		# the vectors joining the sensor and ALL the positions...
+		diff = positions - self.position
 
-		# the distances to ALL the positions are computed
-		distances = np.linalg.norm(np.subtract(positions, self.position), axis=0)
+		# ...are used to compute the squared distances in a single pass
+		squared_distances = np.einsum('ij,ij->j', diff, diff)
 
-		# an empty array with the same dimensions as distances is created
-		likelihoods = np.empty_like(distances)
+		if out is None:
 
-		# the likelihood for a given observation is computed using probability mass function if the target
-		# is within the reach of the sensor...
-		likelihoods[distances < self._threshold] = self._pmf_observations_when_close[observation]
+			out = np.empty_like(squared_distances)
 
-		# ...and a different one if it's outside it
-		likelihoods[distances >= self._threshold] = self._pmf_observations_when_far[observation]
+		# the likelihood for a given observation is computed using one probability mass function if the target is
+		# within the reach of the sensor, and a different one if it's outside it
+		out.fill(self._pmf_observations_when_far[observation])
+		np.copyto(
+			out, self._pmf_observations_when_close[observation], where=squared_distances < self._squared_threshold)
 
-		return likelihoods
+		return out
 
 
 class RSSsensor(Sensor):
@@ -100,15 +176,22 @@ class RSSsensor(Sensor):
 		# the power of the transmitter
 		self._tx_power = transmitter_power
 
-		# the path loss exponent (depending on the medium)
+		# the path loss exponent (depending on the medium)...
 		self._path_loss_exponent = path_loss_exponent
 
+		# ...and a function specialized on it to compute "distances ** (-path loss exponent)" from squared distances
+		self._inverse_path_loss = inverse_path_loss_function(path_loss_exponent)
+
 		# the variance of the additive noise in the model (it is meant to be accessed from outside)
 		self.noise_var = noise_variance
 
-		# ...and, for the sake of efficiency, the standard deviation
+		# ...and, for the sake of efficiency, the standard deviation...
 		self._noise_std = np.sqrt(noise_variance)
 
+		# ...the normalization constant of the corresponding Gaussian pdf and the factor in its exponent
+		self._pdf_normalization_constant = _INV_SQRT_2PI / self._noise_std
+		self._minus_half_inv_variance = -0.5 / noise_variance
+
 		# minimum amount of power the sensor is able to measure
 		self._minimum_power = minimum_amount_of_power
 
@@ -116,44 +199,87 @@ class RSSsensor(Sensor):
 
 		return 10*np.log10(self._tx_power / distances ** self._path_loss_exponent + self._minimum_power)
 
+	def likelihood_mean_from_squared_distances(self, squared_distances):
+
+		# "distances ** self._path_loss_exponent" is obtained from the squared distances without any square root
+		return 10*np.log10(self._tx_power * self._inverse_path_loss(squared_distances) + self._minimum_power)
+
 	def detect(self, target_pos):
 
-		distance = np.linalg.norm((self.position - target_pos))
+		# the position of the target is a (2, 1) array, and hence the squared distance can be computed "by hand"
+		dx = self.position[0, 0] - target_pos[0, 0]
+		dy = self.position[1, 0] - target_pos[1, 0]
 
-		return self.likelihood_mean(distance) + self.measurement_noise()
+		return self.likelihood_mean_from_squared_distances(dx*dx + dy*dy) + self.measurement_noise()
 
 	def measurement_noise(self):
 
 		return self._pseudo_random_numbers_generator.randn()*self._noise_std
 
-	def likelihood(self, observation, positions):
+	def likelihood(self, observation, positions, out=None):
+
+		# the vectors joining the sensor and ALL the positions...
+		diff = positions - self.position
 
-		# the distances to ALL the positions are computed
-		distances = np.linalg.norm(np.subtract(positions, self.position), axis=0)
+		# ...are used to compute the squared distances in a single pass
+		squared_distances = np.einsum('ij,ij->j', diff, diff)
 
-		return scipy.stats.norm.pdf(observation, self.likelihood_mean(distances), self._noise_std)
+		# the residuals...
+		residuals = observation - self.likelihood_mean_from_squared_distances(squared_distances)
+
+		# ...yield the Gaussian pdf without going through the (much slower) "scipy.stats" machinery (every operation is
+		# carried out in place)
+		out = np.square(residuals, out=out)
+		out *= self._minus_half_inv_variance
+		np.exp(out, out=out)
+		out *= self._pdf_normalization_constant
+
+		return out
 
 	def set_parameters(self,  tx_power, minimum_amount_of_power, path_loss_exponent):
 
 		self._tx_power = tx_power
 		self._minimum_power = minimum_amount_of_power
 		self._path_loss_exponent = path_loss_exponent
+		self._inverse_path_loss = inverse_path_loss_function(path_loss_exponent)
 
 
 class RSSsensorsArray:
 
 	def __init__(self, sensors):
 
-		self._tx_power = np.array([s._tx_power for s in sensors])
-		self._minimum_power = np.array([s._minimum_power for s in sensors])
-		self._path_loss_exponent = np.array([s._path_loss_exponent for s in sensors])
+		# the parameters of the sensors are stored as (contiguous, float64) column vectors, ready to be broadcast against
+		# the particles (every column a different one)
+		self._tx_power = np.array([[s._tx_power] for s in sensors], dtype=np.float64)
+		self._minimum_power = np.array([[s._minimum_power] for s in sensors], dtype=np.float64)
+		path_loss_exponent = np.array([[s._path_loss_exponent] for s in sensors], dtype=np.float64)
+
+		# if all the sensors share the same path loss exponent, a specialized function can be used...
+		if not np.any(path_loss_exponent - path_loss_exponent[0]):
+
+			self._inverse_path_loss = inverse_path_loss_function(path_loss_exponent[0, 0])
+
+		# ...and otherwise every sensor (row) is raised to its own power
+		else:
+
+			minus_half_path_loss_exponent = -path_loss_exponent / 2
+
+			self._inverse_path_loss = lambda squared_distances: squared_distances ** minus_half_path_loss_exponent
 
-		self._noise_std = np.array([s._noise_std for s in sensors])
-		self._positions = np.hstack([s.position for s in sensors])
+		self._noise_std = np.array([s._noise_std for s in sensors], dtype=np.float64)
+		self._positions = np.ascontiguousarray(np.hstack([s.position for s in sensors]), dtype=np.float64)
+
+		# all the sensors are assumed to share the same pseudo random numbers generator
+		self._pseudo_random_numbers_generator = sensors[0]._pseudo_random_numbers_generator
 
 		# TODO: "loglikelihood" is only implemented for identical sensors
 		assert not np.any(self._noise_std - self._noise_std[0])
 
+		# the normalization constant of the Gaussian pdf of every sensor and the factor in its exponent (as columns)
+		self._pdf_normalization_constant = (_INV_SQRT_2PI / self._noise_std)[:, np.newaxis]
+		self._minus_half_inv_variance = (-0.5 / self._noise_std**2)[:, np.newaxis]
+		self._log_pdf_normalization_constant = np.log(self._pdf_normalization_constant)
+
 		# for the sake of convenience
 		noise_std = self._noise_std[0]
 
@@ -162,29 +288,69 @@ class RSSsensorsArray:
 		# self.constant = np.log((1./(np.sqrt(2*np.pi)*noise_std))**len(sensors)) ...is equivalent to
 		self.constant = len(sensors)*(-0.5*np.log(2*np.pi) - np.log(noise_std))
 
-	def likelihood(self, observations, positions):
+	@property
+	def positions(self):
 
-		# each row a sensor, every column a different particle (position received)
-		distances = np.linalg.norm(positions[:, np.newaxis, :] - self._positions[:, :, np.newaxis], axis=0)
+		# the positions of all the sensors (one per column)
+		return self._positions
+
+	def likelihood_mean(self, positions):
+
+		# "distances ** path_loss_exponent" is obtained from the squared distances (each row a sensor, every column a
+		# different particle) without any square root...
+		power = self._inverse_path_loss(sensors_squared_distances(self._positions, positions))
+
+		# ...and the received power is turned into dBs in place
+		power *= self._tx_power
+		power += self._minimum_power
+		np.log10(power, out=power)
+		power *= 10
+
+		return power
+
+	def detect(self, target_pos):
+
+		# the mean of the observation of every sensor...
+		likelihood_mean = self.likelihood_mean(target_pos)[:, 0]
+
+		# ...plus noise drawn for all the sensors at once (from the same stream that would be used sensor by sensor)
+		return likelihood_mean + self._pseudo_random_numbers_generator.randn(len(self._noise_std))*self._noise_std
+
+	def likelihood(self, observations, positions, out=None):
 
 		# each row a sensor, every column a different particle (position received)
-		likelihood_mean = 10*np.log10(
-			self._tx_power[:, np.newaxis] / distances ** self._path_loss_exponent[:, np.newaxis] +
-			self._minimum_power[:, np.newaxis]
-		)
+		likelihood_mean = self.likelihood_mean(positions)
 
-		return scipy.stats.norm.pdf(observations[:, np.newaxis], likelihood_mean, self._noise_std[:, np.newaxis])
+		# the residuals overwrite the means...
+		residuals = np.subtract(observations[:, np.newaxis], likelihood_mean, out=likelihood_mean)
 
-	def log_average_likelihood(self, observations, positions):
+		# ...and the Gaussian pdf is computed in place ("scipy.stats.norm.pdf" cannot write into a given array)
+		out = np.square(residuals, out=out)
+		out *= self._minus_half_inv_variance
+		np.exp(out, out=out)
+		out *= self._pdf_normalization_constant
+
+		return out
+
+	def log_likelihood(self, observations, positions, out=None):
 
 		# each row a sensor, every column a different particle (position received)
-		distances = np.linalg.norm(positions[:, np.newaxis, :] - self._positions[:, :, np.newaxis], axis=0)
+		likelihood_mean = self.likelihood_mean(positions)
+
+		# the residuals overwrite the means...
+		residuals = np.subtract(observations[:, np.newaxis], likelihood_mean, out=likelihood_mean)
+
+		# ...and the logarithm of the Gaussian pdf is computed in place without ever exponentiating (it cannot underflow)
+		out = np.square(residuals, out=out)
+		out *= self._minus_half_inv_variance
+		out += self._log_pdf_normalization_constant
+
+		return out
+
+	def log_average_likelihood(self, observations, positions):
 
 		# each row a sensor, every column a different particle (position received)
-		likelihood_mean = 10*np.log10(
-			self._tx_power[:, np.newaxis] / distances ** self._path_loss_exponent[:, np.newaxis] +
-			self._minimum_power[:, np.newaxis]
-		)
+		likelihood_mean = self.likelihood_mean(positions)
 
 		# exponents
 		l = ((observations[:, np.newaxis] - likelihood_mean)**2).sum(axis=0)/self.twice_the_variance
@@ -198,21 +364,79 @@ class BinarySensorsArray:
 
 		self._sensors_range = np.arange(len(sensors))
 
-		self._positions = np.hstack([s.position for s in sensors])
-		self._thresholds = np.array([s._threshold for s in sensors])
+		self._positions = np.ascontiguousarray(np.hstack([s.position for s in sensors]), dtype=np.float64)
+		self._thresholds = np.array([s._threshold for s in sensors], dtype=np.float64)
+		self._squared_thresholds = self._thresholds**2
+
+		self._prob_detection = np.array([s._prob_detection for s in sensors])
+		self._prob_false_alarm = np.array([s._prob_false_alarm for s in sensors])
+
+		# all the sensors are assumed to share the same pseudo random numbers generator
+		self._pseudo_random_numbers_generator = sensors[0]._pseudo_random_numbers_generator
 
 		self._pmf_obs_when_close = np.vstack([s._pmf_observations_when_close for s in sensors])
 		self._pmf_observations_when_far = np.vstack([s._pmf_observations_when_far for s in sensors])
 
 		self._full = np.stack((self._pmf_obs_when_close, self._pmf_observations_when_far))
 
-	def likelihood(self, observations, positions):
+	@property
+	def positions(self):
 
-		# each row a sensor, every column a different particle (position received)
-		distances = np.linalg.norm(positions[:, np.newaxis, :] - self._positions[:, :, np.newaxis], axis=0)
+		# the positions of all the sensors (one per column)
+		return self._positions
+
+	def detect(self, target_pos):
+
+		# the vectors joining every sensor and the target...
+		diff = target_pos - self._positions
+
+		# ...yield the squared distances
+		squared_distances = np.einsum('ij,ij->j', diff, diff)
+
+		# a uniform sample for every sensor is drawn at once (from the same stream that would be used sensor by sensor)
+		u = self._pseudo_random_numbers_generator.rand(len(self._thresholds))
+
+		return np.where(
+			squared_distances < self._squared_thresholds, u < self._prob_detection, u < self._prob_false_alarm)
+
+	def likelihood(self, observations, positions, out=None):
+
+		# the squared distances (each row a sensor, every column a different particle)
+		squared_distances = sensors_squared_distances(self._positions, positions)
+
+		# the probability of the observation made by every sensor when the target is close and far
+		observations = observations.astype(int)
+		likelihood_when_close = self._pmf_obs_when_close[self._sensors_range, observations][:, np.newaxis]
+		likelihood_when_far = self._pmf_observations_when_far[self._sensors_range, observations][:, np.newaxis]
+
+		if out is None:
+
+			out = np.empty_like(squared_distances)
+
+		# every particle is assigned one or the other depending on its distance to every sensor
+		np.copyto(out, likelihood_when_far)
+		np.copyto(
+			out, np.broadcast_to(likelihood_when_close, out.shape),
+			where=squared_distances < self._squared_thresholds[:, np.newaxis])
+
+		return out
+
+	def log_likelihood(self, observations, positions, out=None):
+
+		# the likelihoods are computed as usual (every one of them is a probability out of a few possible values)...
+		out = self.likelihood(observations, positions, out=out)
+
+		# ...and in order to avoid floating point arithmetic issues when taking the logarithm
+		out += 1e-200
+
+		return np.log(out, out=out)
+
+
+def build_sensors_array(sensors):
 
-		return self._full[
-			(distances >= np.broadcast_to(self._thresholds[:, np.newaxis], distances.shape)).astype(int),
-			np.broadcast_to(self._sensors_range[:, np.newaxis], distances.shape),
-			np.broadcast_to(observations[:, np.newaxis], distances.shape).astype(int)
-		]
\ No newline at end of file
+	if isinstance(sensors[0], RSSsensor):
+		return RSSsensorsArray(sensors)
+	elif isinstance(sensors[0], BinarySensor):
+		return BinarySensorsArray(sensors)
+	else:
+		raise Exception('an array of this type of sensor is not supported')
@@ -1,7 +1,84 @@
 import abc
+import heapq
+import itertools
+
 import numpy as np
 
-import networkx
+
+def bipartite_havel_hakimi(sensors_degrees, PEs_degrees):
+
+	"""Builds a bipartite graph with the given degrees by means of the Havel-Hakimi algorithm.
+
+	It yields the same connections as "networkx.bipartite_havel_hakimi_graph", but the PEs are kept in a (max) heap
+	rather than being sorted again every time a sensor is connected.
+
+	Parameters
+	----------
+	sensors_degrees: list
+		the number of PEs every sensor must be connected to
+	PEs_degrees: list
+		the number of sensors every PE must be connected to
+
+	Returns
+	-------
+	connections: list of lists
+		Each list contains the indexes of the sensors connected to the corresponding PE.
+	"""
+
+	assert sum(sensors_degrees) == sum(PEs_degrees)
+
+	connections = [[] for _ in PEs_degrees]
+
+	# degrees and indexes are negated so that the PE with the largest remaining degree (and, in case of a tie, the
+	# largest index) is on top of the heap
+	PEs_heap = [(-degree, -i_PE) for i_PE, degree in enumerate(PEs_degrees) if degree > 0]
+	heapq.heapify(PEs_heap)
+
+	# the sensors are processed in decreasing order of degree (and, in case of a tie, index)
+	for degree, i_sensor in sorted(zip(sensors_degrees, range(len(sensors_degrees))), reverse=True):
+
+		if degree == 0:
+
+			break
+
+		# the PEs with the largest remaining degree are connected to this sensor...
+		selected = [heapq.heappop(PEs_heap) for _ in range(min(degree, len(PEs_heap)))]
+
+		for minus_remaining_degree, minus_i_PE in selected:
+
+			connections[-minus_i_PE].append(i_sensor)
+
+			# ...and, if they still need more connections, they are put back into the heap
+			if minus_remaining_degree < -1:
+
+				heapq.heappush(PEs_heap, (minus_remaining_degree + 1, minus_i_PE))
+
+	return connections
+
+
+def connections_to_csr(connections):
+
+	"""Converts a list of lists of connections into compressed sparse row (CSR) format.
+
+	Parameters
+	----------
+	connections: list of lists
+		Each list contains the indexes of the sensors connected to the corresponding PE.
+
+	Returns
+	-------
+	indptr: ndarray
+		The sensors of the i-th PE are those in "indices[indptr[i]:indptr[i+1]]".
+	indices: ndarray
+		The indexes of the sensors of every PE, one after another.
+	"""
+
+	indptr = np.zeros(len(connections) + 1, dtype=np.int32)
+	indptr[1:] = np.cumsum([len(sensors) for sensors in connections])
+
+	indices = np.fromiter(itertools.chain.from_iterable(connections), dtype=np.int32, count=indptr[-1])
+
+	return indptr, indices
 
 
 def sensors_PEs_mapping(PEs_sensors_mapping):
@@ -59,10 +136,9 @@ class SensorOrientedConnector(SensorsPEsConnector):
 			PEs_degrees[iPE] +=  1
 	
 		# a bipartite graph with one set of nodes given by the sensors and other by the PEs
-		graph = networkx.bipartite_havel_hakimi_graph(sensors_degrees, PEs_degrees)
+		connections = bipartite_havel_hakimi(sensors_degrees, PEs_degrees)
 		
-		# we only "look" at the nodes from "self._n_sensors" onwards, since the previous ones correspond to the sensors
-		return [sorted(graph.neighbors(iPE+self._nSensors)) for iPE in range(n_PEs)]
+		return [sorted(sensors) for sensors in connections]
 
 
 class ProximityBasedConnector(SensorsPEsConnector):
@@ -74,8 +150,8 @@ class ProximityBasedConnector(SensorsPEsConnector):
 	def get_connections(self, n_PEs):
 		
 		# the distance from each PE (whose position has been computed above) to each sensor [<PE>,<sensor>]
-		distances = np.sqrt(
-			(np.subtract(self._PEsPositions[:, :, np.newaxis], self._sensorsPositions[:, np.newaxis, :])**2).sum(axis=0))
+		distances = np.linalg.norm(
+			self._PEsPositions[:, :, np.newaxis] - self._sensorsPositions[:, np.newaxis, :], axis=0)
 		
 		# for each sensor, the index of the PE which is closest to it
 		i_closest_pe_to_sensors = distances.argmin(axis=0)
@@ -119,7 +195,8 @@ class ConstrainedProximityBasedConnector(ProximityBasedConnector):
 				remaining_PEs_positions = self._PEsPositions[:, i_PEs_decreasing_n_sensors[i+1:]]
 				
 				# the (i,j) element is the distance from the i-th sensor to the j-th remaining PE
-				distances = np.sqrt(((sensors_positions[:, :, np.newaxis] - remaining_PEs_positions[:, np.newaxis, :])**2).sum(axis=0))
+				distances = np.linalg.norm(
+					sensors_positions[:, :, np.newaxis] - remaining_PEs_positions[:, np.newaxis, :], axis=0)
 				
 				for _ in range(n_sensors_to_drop):
 					
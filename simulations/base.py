@@ -53,6 +53,9 @@ class Simulation(metaclass=abc.ABCMeta):
 		# the parameters for this particular simulation are obtained
 		self._simulation_parameters = parameters['simulations'][parameters['simulation type']]
 
+		# whether or not the progress of the simulation (and the estimates) are printed at every time instant
+		self._verbose = parameters.get("verbose", False)
+
 	@abc.abstractmethod
 	def process_frame(self, target_position, target_velocity):
 
@@ -60,6 +63,13 @@ class Simulation(metaclass=abc.ABCMeta):
 
 	# TODO: remove target_position as argument?
 
+	def close(self):
+
+		"""It releases any resource (e.g., the thread pools of the particle filters) held by the simulation.
+		"""
+
+		pass
+
 	@abc.abstractmethod
 	def save_data(self, target_position):
 
@@ -83,8 +93,9 @@ class SimpleSimulation(Simulation):
 		# if a reference to an HDF5 file was not received...
 		if h5py_file is None:
 
-			# ...a new HDF5 file is created
-			self._f = h5py.File(self._output_file_basename + '.hdf5', 'w', driver='core', libver='latest')
+			# ...a new HDF5 file is created (with the default driver, so that every flush only writes what changed
+			# rather than the whole in-memory image of the file)
+			self._f = h5py.File(self._output_file_basename + '.hdf5', 'w', libver='latest')
 
 		# otherwise...
 		else:
@@ -133,6 +144,9 @@ class SimpleSimulation(Simulation):
 			**sensors_settings[parameters['sensors type']]['parameters']
 		) for pos in self._sensors_positions.T]
 
+		# the sensors are also gathered in an array so that all of them can make their observations at once
+		self._sensors_array = sensor.build_sensors_array(self._sensors)
+
 		self._f.create_dataset(
 			self._h5py_prefix + 'room/bottom left corner',
 			parameters['room']['bottom left corner'].shape, data=parameters['room']['bottom left corner'])
@@ -165,9 +179,8 @@ class SimpleSimulation(Simulation):
 		# observations for all the sensors at every time instant (each list)
 		# REMARK: conversion to float is done so that the observations (when 1 or 0) are amenable to be used in later
 		# computations
-		self._observations = [np.array(
-			[sens.detect(state.to_position(s[:, np.newaxis])) for sens in self._sensors], dtype=float
-		) for s in target_position.T]
+		self._observations = [
+			self._sensors_array.detect(state.to_position(s[:, np.newaxis])).astype(float) for s in target_position.T]
 
 	def save_data(self, target_position):
 
@@ -1,3 +1,5 @@
+import concurrent.futures
+
 import numpy as np
 import scipy.io
 import h5py
@@ -74,16 +76,29 @@ class Convergence(simulations.base.SimpleSimulation):
 			resampling_algorithm, resampling_criterion, prior, transition_kernel, self._sensors,
 			PEs_sensors_requirements.get_connections(e.n_processing_elements)) for e in exchange_recipes]
 
+		# if requested, the different topologies are processed concurrently (the heavy lifting happens within NumPy,
+		# which releases the GIL)...but notice that the pseudo random numbers generators are shared by all the
+		# topologies, and hence results are only reproducible when a single thread is used
+		n_threads = self._settings_DRNA.get("number of threads", 1)
+
+		self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+			max_workers=min(n_threads, len(topologies))) if n_threads > 1 else None
+
 		# ------------------------------------------ metrics initialization --------------------------------------------
 
-		# we store the aggregated weights...
-		self._distributedPFaggregatedWeights = [np.empty(
-			(self._n_time_instants, t.n_processing_elements, parameters["number of frames"])
-		) for t in topologies]
+		# the number of PEs in every topology
+		self._n_PEs_topologies = [t.n_processing_elements for t in topologies]
+
+		# we store the aggregated weights (for all the topologies in a single array, padded with zeros up to the
+		# largest number of PEs)...
+		self._distributedPFaggregatedWeights = np.zeros((
+			len(topologies), self._n_time_instants, max(self._n_PEs_topologies), parameters["number of frames"]))
 
-		# ...and the position estimates
-		self._centralizedPF_pos = np.empty((2, self._n_time_instants, parameters["number of frames"], len(topologies)))
-		self._distributedPF_pos = np.empty((2, self._n_time_instants, parameters["number of frames"], len(topologies)))
+		# ...and the position estimates (single precision is more than enough for positions)
+		self._centralizedPF_pos = np.empty(
+			(2, self._n_time_instants, parameters["number of frames"], len(topologies)), dtype=np.float32)
+		self._distributedPF_pos = np.empty(
+			(2, self._n_time_instants, parameters["number of frames"], len(topologies)), dtype=np.float32)
 
 		# HDF5
 
@@ -119,14 +134,15 @@ class Convergence(simulations.base.SimpleSimulation):
 		# FIXME: this method should only be called after completing a frame (never in the middle)
 		self._i_current_frame += 1
 
-		# the aggregated weights are normalized at ALL TIMES, for EVERY frame and EVERY topology
-		normalized_aggregated_weights = [
-			w[:, :, :self._i_current_frame] / w[:, :, :self._i_current_frame].sum(axis=1)[:, np.newaxis, :]
-			for w in self._distributedPFaggregatedWeights]
+		# the aggregated weights are normalized at ALL TIMES, for EVERY frame and EVERY topology with a single broadcast
+		# division (the zero padding doesn't change the sums)
+		aggregated_weights = self._distributedPFaggregatedWeights[..., :self._i_current_frame]
+		normalized_aggregated_weights = aggregated_weights / aggregated_weights.sum(axis=2, keepdims=True)
 
-		# ...the same data structured in a dictionary
+		# ...the same data (without padding) structured in a dictionary
 		dic_normalized_aggregated_weights = {
-			'normalizedAggregatedWeights_{}'.format(i): array for i, array in enumerate(normalized_aggregated_weights)}
+			'normalizedAggregatedWeights_{}'.format(i): normalized_aggregated_weights[i, :, :n_PEs]
+			for i, n_PEs in enumerate(self._n_PEs_topologies)}
 
 		# a dictionary encompassing all the data to be saved
 		data_to_be_saved = dict(
@@ -144,51 +160,100 @@ class Convergence(simulations.base.SimpleSimulation):
 		# the above fix is undone
 		self._i_current_frame -= 1
 
-	def process_frame(self, target_position, target_velocity):
+	def close(self):
 
-		# let the super class do its thing...
-		super().process_frame(target_position, target_velocity)
+		# the threads (if any) in which the topologies are processed are shut down...
+		if self._thread_pool is not None:
 
-		for iTopology, (pf, distributed_pf) in enumerate(zip(self._PFsForTopologies, self._distributedPFsForTopologies)):
+			self._thread_pool.shutdown()
 
-			n_PEs = self._settings_topologies[iTopology]['number of PEs']
+		# ...and every particle filter releases its resources
+		for pf in self._PFsForTopologies + self._distributedPFsForTopologies:
 
-			# the last dimension is for the number of algorithms (centralized and distributed)
-			estimated_pos = np.full((state.n_elements_position, self._n_time_instants, 2), np.nan)
+			pf.close()
 
-			aggregated_weights = np.full((self._n_time_instants, n_PEs), np.nan)
+	def process_topology(self, iTopology, target_position, target_velocity):
 
-			# initialization of the particle filters
-			pf.initialize()
-			distributed_pf.initialize()
+		pf, distributed_pf = self._PFsForTopologies[iTopology], self._distributedPFsForTopologies[iTopology]
 
-			for iTime in range(self._n_time_instants):
+		n_PEs = self._settings_topologies[iTopology]['number of PEs']
 
-				print('---------- iFrame = {}, iTopology = {}, iTime = {}'.format(self._i_current_frame, iTopology, iTime))
+		# the last dimension is for the number of algorithms (centralized and distributed)...
+		estimated_pos = np.full((state.n_elements_position, self._n_time_instants, 2), np.nan)
+
+		# ...and a buffer for the state estimates
+		mean = np.empty((state.n_elements, 1))
+
+		aggregated_weights = np.full((self._n_time_instants, n_PEs), np.nan)
+
+		# initialization of the particle filters
+		pf.initialize()
+		distributed_pf.initialize()
+
+		for iTime in range(self._n_time_instants):
+
+			if self._verbose:
+
+				print('---------- iFrame = {}, iTopology = {}, iTime = {}'.format(
+					self._i_current_frame, iTopology, iTime))
 
 				print('position:\n', target_position[:, iTime:iTime+1])
 				print('velocity:\n', target_velocity[:, iTime:iTime+1])
 
-				# particle filters are updated
-				pf.step(self._observations[iTime])
-				distributed_pf.step(self._observations[iTime])
+			# particle filters are updated
+			pf.step(self._observations[iTime])
+			distributed_pf.step(self._observations[iTime])
 
-				# the mean computed by the centralized and distributed PFs
-				centralizedPF_mean, distributedPF_mean = pf.compute_mean(), distributed_pf.compute_mean()
+			# the mean computed by the centralized and distributed PFs is written in place
+			centralizedPF_mean = pf.compute_mean(out=mean)
+			state.to_position(centralizedPF_mean, out=estimated_pos[:, iTime:iTime+1, 0])
 
-				estimated_pos[:, iTime:iTime+1, 0] = state.to_position(centralizedPF_mean)
-				estimated_pos[:, iTime:iTime+1, 1] = state.to_position(distributedPF_mean)
+			distributedPF_mean = distributed_pf.compute_mean()
+			state.to_position(distributedPF_mean, out=estimated_pos[:, iTime:iTime+1, 1])
 
-				self._centralizedPF_pos[:, iTime:iTime+1, self._i_current_frame, iTopology] = state.to_position(centralizedPF_mean)
-				self._distributedPF_pos[:, iTime:iTime+1, self._i_current_frame, iTopology] = state.to_position(distributedPF_mean)
+			# the aggregated weights of the different PEs in the distributed PF are stored
+			aggregated_weights[iTime, :] = distributed_pf.aggregated_weights
 
-				# the aggregated weights of the different PEs in the distributed PF are stored
-				self._distributedPFaggregatedWeights[iTopology][iTime, :, self._i_current_frame] = distributed_pf.aggregated_weights
-				aggregated_weights[iTime, :] = distributed_pf.aggregated_weights
+			if self._verbose:
 
 				print('centralized PF\n', centralizedPF_mean)
 				print('distributed PF\n', distributedPF_mean)
 
+		return estimated_pos, aggregated_weights
+
+	def process_frame(self, target_position, target_velocity):
+
+		# let the super class do its thing...
+		super().process_frame(target_position, target_velocity)
+
+		# when not verbose, a single line per frame is printed
+		if not self._verbose:
+
+			print('---------- iFrame = {}'.format(self._i_current_frame))
+
+		i_topologies = range(len(self._PFsForTopologies))
+
+		# every topology is processed (either sequentially or concurrently)...
+		if self._thread_pool is None:
+
+			topologies_results = [
+				self.process_topology(iTopology, target_position, target_velocity) for iTopology in i_topologies]
+
+		else:
+
+			topologies_results = list(self._thread_pool.map(
+				lambda iTopology: self.process_topology(iTopology, target_position, target_velocity), i_topologies))
+
+		# ...and the results are saved (always from this thread)
+		for iTopology, (estimated_pos, aggregated_weights) in enumerate(topologies_results):
+
+			n_PEs = self._settings_topologies[iTopology]['number of PEs']
+
+			# the results for the whole frame are copied at once into the arrays gathering all the frames and topologies
+			self._centralizedPF_pos[..., self._i_current_frame, iTopology] = estimated_pos[..., 0]
+			self._distributedPF_pos[..., self._i_current_frame, iTopology] = estimated_pos[..., 1]
+			self._distributedPFaggregatedWeights[iTopology, :, :n_PEs, self._i_current_frame] = aggregated_weights
+
 			# data is saved
 			h5_estimated_pos = self._h5_current_frame.create_dataset(
 				'topology/{}/estimated position'.format(iTopology), shape=estimated_pos.shape, dtype=float,
@@ -47,6 +47,12 @@ class MultipleMposterior(simulations.base.Simulation):
 		for sim in self._simulations:
 			sim.process_frame(target_position, target_velocity)
 
+	def close(self):
+
+		for sim in self._simulations:
+
+			sim.close()
+
 	def save_data(self, target_position):
 
 		# let the super class do its thing...
@@ -159,9 +165,9 @@ class Mposterior(simulations.base.SimpleSimulation):
 
 		# ============================================================================================
 
-		# the position estimates
+		# the position estimates (single precision is more than enough for positions)
 		self._estimated_pos = np.empty(
-			(2, self._n_time_instants, parameters["number of frames"], len(self._estimators)))
+			(2, self._n_time_instants, parameters["number of frames"], len(self._estimators)), dtype=np.float32)
 
 		assert len(self._estimators_colors) == len(self._estimators_labels) == len(self._estimators)
 
@@ -239,14 +245,16 @@ class Mposterior(simulations.base.SimpleSimulation):
 			smc.exchange_recipe.SameParticlesMposteriorWithinRadiusExchangeRecipe(
 				self._PEsTopology, self._n_particles_per_PE, self._exchanged_particles,
 				self._MposteriorSettings['findWeiszfeldMedian parameters'], 1,
-				PRNG=self._PRNGs["topology pseudo random numbers generator"]),
+				PRNG=self._PRNGs["topology pseudo random numbers generator"],
+				n_threads=self._MposteriorSettings.get("number of threads", 1)),
 			self._MposteriorSettings["number of iterations"])
 
 		mposterior_within_radius_exchange_recipe = smc.exchange_recipe.IteratedExchangeRecipe(
 			smc.exchange_recipe.SameParticlesMposteriorWithinRadiusExchangeRecipe(
 				self._PEsTopology, self._n_particles_per_PE, self._exchanged_particles,
 				self._MposteriorSettings['findWeiszfeldMedian parameters'], self._mposterior_exchange_step_depth,
-				PRNG=self._PRNGs["topology pseudo random numbers generator"]),
+				PRNG=self._PRNGs["topology pseudo random numbers generator"],
+				n_threads=self._MposteriorSettings.get("number of threads", 1)),
 			self._MposteriorSettings["number of iterations"])
 
 		# ------------
@@ -416,7 +424,16 @@ class Mposterior(simulations.base.SimpleSimulation):
 		scipy.io.savemat('res_' + self._output_file_basename, data_to_be_saved)
 		print('results saved in "{}"'.format(self._output_file_basename))
 
-		print(self._estimated_pos)
+		if self._verbose:
+
+			print(self._estimated_pos)
+
+	def close(self):
+
+		# every particle filter releases its resources
+		for pf in self._PFs:
+
+			pf.close()
 
 	def process_frame(self, target_position, target_velocity):
 
@@ -431,13 +448,22 @@ class Mposterior(simulations.base.SimpleSimulation):
 			# ...initialization
 			pf.initialize()
 
+		# when not verbose, a single line per frame is printed
+		if not self._verbose:
+
+			print(colorama.Fore.LIGHTWHITE_EX + '---------- iFrame = {}'.format(
+				self._i_current_frame) + colorama.Style.RESET_ALL)
+
 		for iTime in range(self._n_time_instants):
 
-			print(colorama.Fore.LIGHTWHITE_EX + '---------- iFrame = {}, iTime = {}'.format(self._i_current_frame,
-			                                                                                iTime) + colorama.Style.RESET_ALL)
+			if self._verbose:
+
+				print(colorama.Fore.LIGHTWHITE_EX + '---------- iFrame = {}, iTime = {}'.format(
+					self._i_current_frame, iTime) + colorama.Style.RESET_ALL)
 
-			print(colorama.Fore.CYAN + 'position:\n' + colorama.Style.RESET_ALL, target_position[:, iTime:iTime + 1])
-			print(colorama.Fore.YELLOW + 'velocity:\n' + colorama.Style.RESET_ALL, target_velocity[:, iTime:iTime + 1])
+				print(colorama.Fore.CYAN + 'position:\n' + colorama.Style.RESET_ALL, target_position[:, iTime:iTime + 1])
+				print(
+					colorama.Fore.YELLOW + 'velocity:\n' + colorama.Style.RESET_ALL, target_velocity[:, iTime:iTime + 1])
 
 			# for every PF (different from estimator)...
 			for pf in self._PFs:
@@ -454,8 +480,9 @@ class Mposterior(simulations.base.SimpleSimulation):
 				# the position given by this estimator at the current time instant is written to the HDF5 file
 				estimated_pos[:, iTime:iTime + 1, iEstimator] = current_estimated_pos
 
-				print('position estimated by {}\n'.format(label),
-				      self._estimated_pos[:, iTime:iTime + 1, self._i_current_frame, iEstimator])
+				if self._verbose:
+
+					print('position estimated by {}\n'.format(label), current_estimated_pos)
 
 		# the results (estimated positions) are saved
 		self._h5_current_frame.create_dataset(
@@ -604,7 +631,8 @@ class MposteriorRevisited(Mposterior):
 			smc.exchange_recipe.SameParticlesMposteriorWithinRadiusExchangeRecipe(
 				self._PEsTopology, self._n_particles_per_PE, self._exchanged_particles,
 				self._MposteriorSettings['findWeiszfeldMedian parameters'], self._mposterior_exchange_step_depth,
-				PRNG=self._PRNGs["topology pseudo random numbers generator"]),
+				PRNG=self._PRNGs["topology pseudo random numbers generator"],
+				n_threads=self._MposteriorSettings.get("number of threads", 1)),
 			self._MposteriorSettings["number of iterations"])
 
 		gaussian_exchange_recipe = smc.exchange_recipe.GaussianExchangeRecipe(
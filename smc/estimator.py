@@ -14,28 +14,29 @@ def geometric_median(points, max_iterations=100, tolerance=0.001):
 
 	for i in range(max_iterations):
 
-		# the norms for the vectors joining the previous estimate with every point
-		norms = numpy.linalg.norm(np.subtract(points, estimate[:, np.newaxis]), axis=0)
+		# the vectors joining the previous estimate with every point...
+		diff = points - estimate[:, np.newaxis]
 
-		# is any of the norms is zero?
-		is_zero = np.isclose(norms, 0.0)
+		# ...yield the squared norms in a single pass, and then the norms (the square root is taken in place)
+		norms = np.einsum('ij,ij->j', diff, diff)
+		np.sqrt(norms, out=norms)
 
-		# if one of the norms is zero (there should be one at most)
-		if np.any(is_zero):
+		# the smallest norm is the only one that might be zero (same tolerance as "np.isclose(norms, 0.0)")
+		i_min_norm = norms.argmin()
 
-			# we find out its position...
-			i_zero_norm, = np.where(is_zero)
+		# if one of the norms is zero (there should be one at most)
+		if norms[i_min_norm] <= 1e-8:
 
-			# ...and the estimate of the median is the corresponding point
-			estimate = points[:, i_zero_norm[0]]
+			# ...the estimate of the median is (a copy of) the corresponding point
+			estimate = points[:, i_min_norm].copy()
 
 			return estimate
 
-		# this is used a couple of times below
-		invnorms = 1.0 / norms
+		# this is used a couple of times below (computed in place)
+		invnorms = np.reciprocal(norms, out=norms)
 
-		# a new estimate according to the Weiszfeld algorithm
-		new_estimate = np.multiply(points, invnorms[np.newaxis, :]).sum(axis=1)/invnorms.sum()
+		# a new estimate according to the Weiszfeld algorithm (the weighted sum is a matrix-vector product)
+		new_estimate = (points @ invnorms)/invnorms.sum()
 
 		# if the new estimate is close enough to the old one...
 		if numpy.linalg.norm(new_estimate-estimate) < tolerance:
@@ -56,11 +57,26 @@ class Estimator:
 		self.DPF = distributed_particle_filter
 		self.i_PE = i_PE
 
+		# the topology for which the number of hops below was computed
+		self._hops_topology = None
+		self._hops = None
+
 	# by default, it is assumed no communication is required
 	def messages(self, PEs_topology):
 
 		return 0
 
+	def hops_to_every_PE(self, PEs_topology):
+
+		# the sum of the distances (in hops) from the "i_PE"-th PE to every other is only recomputed if the topology
+		# changes
+		if PEs_topology is not self._hops_topology:
+
+			self._hops = PEs_topology.distances_between_processing_elements[self.i_PE, :].sum()
+			self._hops_topology = PEs_topology
+
+		return self._hops
+
 	def estimate(self):
 
 		return
@@ -77,39 +93,47 @@ class Mean(Estimator):
 
 	def estimate(self):
 
-		# the means from all the PEs are stacked (horizontally) in a single array
-		joint_means = np.hstack([PE.compute_mean() for PE in self.DPF.PEs])
+		# the number of particles of every PE, and the position of the first one when the particles of all the PEs are
+		# put together
+		n_particles = np.array([PE.n_particles for PE in self.DPF.PEs])
+		i_first_particles = np.cumsum(n_particles) - n_particles
+
+		# the samples and log-weights of all the PEs
+		samples, log_weights = self.DPF.get_state(), self.DPF.get_log_weights()
+
+		# the weights of every PE are exponentiated after subtracting its largest log-weight...
+		weights = np.exp(log_weights - np.maximum.reduceat(log_weights, i_first_particles).repeat(n_particles))
+
+		# ...and the means from all the PEs (one per column) are computed at once, by adding up the weighted samples and
+		# the weights within every PE
+		joint_means = np.add.reduceat(samples * weights, i_first_particles, axis=1) / np.add.reduceat(
+			weights, i_first_particles)
 
 		return joint_means.mean(axis=1)[:, np.newaxis]
 
 	def messages(self, PEs_topology):
 
-		# the distances (in hops) between each pair of PEs
-		distances = PEs_topology.distances_between_processing_elements
-
-		return distances[self.i_PE, :].sum() * state.n_elements_position
+		return self.hops_to_every_PE(PEs_topology) * state.n_elements_position
 
 
 class WeightedMean(Mean):
 
 	def estimate(self):
 
-		aggregated_weights = self.DPF.aggregated_weights
+		# the log-weights of all the particles in all the PEs
+		log_weights = self.DPF.get_log_weights()
 
-		# the aggregated weights are not necessarily normalized
-		normalized_aggregated_weights = aggregated_weights/aggregated_weights.sum()
+		# the (non normalized) weights, after subtracting the largest log-weight to avoid underflow
+		weights = np.exp(log_weights - log_weights.max())
 
-		# notice that "compute_mean" will return a numpy array the size of the state (rather than a scalar)
-		return np.multiply(
-			np.hstack([PE.compute_mean() for PE in self.DPF.PEs]),
-			normalized_aggregated_weights).sum(axis=1)[:, np.newaxis]
+		# since the aggregated weight of every PE is the sum of its weights, weighting the mean of every PE by its
+		# (normalized) aggregated weight is tantamount to a weighted mean of all the particles: a matrix-vector product
+		return (self.DPF.get_state() @ weights)[:, np.newaxis] / weights.sum()
 
 	def messages(self, PEs_topology):
 
-		distances = PEs_topology.distances_between_processing_elements
-
 		# the same as in "Mean" but we also have to transmit the aggregated weight
-		return super().messages(PEs_topology) + distances[self.i_PE, :].sum()
+		return super().messages(PEs_topology) + self.hops_to_every_PE(PEs_topology)
 
 
 class Mposterior(Estimator):
@@ -124,22 +148,24 @@ class Mposterior(Estimator):
 
 		joint_particles, joint_weights = mposterior.find_weiszfeld_median(posteriors, **self.weiszfeld_parameters)
 
-		return np.multiply(joint_particles, joint_weights).sum(axis=1)[np.newaxis].T
+		# the weighted mean of the joint particles as a single matrix-vector product
+		return (joint_particles @ joint_weights)[:, np.newaxis]
 
 	def estimate(self):
 
-		# the (FULL) distributions computed by all the PEs are gathered in a list of tuples (samples and weights)
-		posteriors = [(PE.samples.T, np.exp(PE.log_weights)) for PE in self.DPF.PEs]
+		# the position of the first particle of every PE (but the first) when the particles of all of them are together
+		i_first_particles = np.cumsum([PE.n_particles for PE in self.DPF.PEs[:-1]])
+
+		# the (FULL) distributions computed by all the PEs are split (into views) from the samples of all of them (the
+		# median is computed assuming uniform weights, and hence only the samples are needed)
+		posteriors = np.split(self.DPF.get_state().T, i_first_particles)
 
 		return self.combine_posterior_distributions(posteriors)
 
 	def messages(self, PEs_topology):
 
-		# the distances (in hops) between each pair of PEs
-		distances = PEs_topology.distances_between_processing_elements
-
 		# TODO: this assumes all PEs have the same number of particles: that of the self.i_PE-th one
-		return distances[self.i_PE, :].sum() * self.DPF.PEs[self.i_PE].n_particles * state.n_elements_position
+		return self.hops_to_every_PE(PEs_topology) * self.DPF.PEs[self.i_PE].n_particles * state.n_elements_position
 
 
 class GeometricMedian(Estimator):
@@ -151,19 +177,21 @@ class GeometricMedian(Estimator):
 		self._maxIterations = max_iterations
 		self._tolerance = tolerance
 
+	def first_particles(self):
+
+		# the position of the first particle of every PE when the particles of all of them are put together
+		return np.cumsum([0] + [PE.n_particles for PE in self.DPF.PEs[:-1]])
+
 	def estimate(self):
 
-		# the first (0) sample of each PE is collected
-		samples = np.hstack([PE.get_samples_at([0]) for PE in self.DPF.PEs])
+		# the first (0) sample of each PE is collected (with a single gather from the samples of all the PEs)
+		samples = self.DPF.get_state()[:, self.first_particles()]
 
 		return geometric_median(samples, max_iterations=self._maxIterations, tolerance=self._tolerance)[:, np.newaxis]
 
 	def messages(self, PEs_topology):
 
-		# the distances (in hops) between each pair of PEs
-		distances = PEs_topology.distances_between_processing_elements
-
-		return distances[self.i_PE, :].sum() * state.n_elements_position
+		return self.hops_to_every_PE(PEs_topology) * state.n_elements_position
 
 
 class StochasticGeometricMedian(GeometricMedian):
@@ -177,11 +205,14 @@ class StochasticGeometricMedian(GeometricMedian):
 
 	def estimate(self):
 
-		# a number of samples is drawn from the distribution of each PE (all equally weighted)
-		# to build a list of tuples (samples and weights)
-		samples = np.hstack(
-			[PE.get_samples_at(self.DPF._resamplingAlgorithm.get_indexes(np.exp(PE.log_weights),
-			                                                             self.n_particles)) for PE in self.DPF.PEs])
+		# a number of samples is drawn from the distribution of each PE (all equally weighted): the indexes drawn
+		# within every PE are turned into indexes within the particles of all the PEs...
+		i_samples = np.concatenate([
+			i_first + self.DPF._resampling_algorithm.get_indexes(PE.normalized_weights, self.n_particles)
+			for i_first, PE in zip(self.first_particles(), self.DPF.PEs)])
+
+		# ...so that they are collected with a single gather
+		samples = self.DPF.get_state()[:, i_samples]
 
 		return geometric_median(samples, max_iterations=self._maxIterations, tolerance=self._tolerance)[:, np.newaxis]
 
@@ -231,17 +262,28 @@ class SinglePEGeometricMedianWithinRadius(SinglePEGeometricMedian):
 		# the selected PE is also included
 		self._i_relevant_PEs.append(self.i_PE)
 
+		# the number of hops from the selected PE to all the relevant ones
+		self._relevant_hops = self._distances[self.i_PE, self._i_relevant_PEs].sum()
+
+		# buffer in which the samples from the relevant PEs are gathered (every PE fills a contiguous block of columns)
+		self._samples = np.empty((state.n_elements, len(self._i_relevant_PEs) * self.n_particles))
+
 	def estimate(self):
 
-		# the first "self.n_particles" samples from each of the above PEs
-		samples = np.vstack([self.DPF.PEs[iPE].get_samples_at(range(self.n_particles)).T for iPE in self._i_relevant_PEs]).T
+		# the first "self.n_particles" samples from each of the above PEs are copied into the buffer
+		for i, iPE in enumerate(self._i_relevant_PEs):
+
+			self._samples[:, i * self.n_particles:(i + 1) * self.n_particles] = \
+				self.DPF.PEs[iPE].samples[:, :self.n_particles]
+
+		samples = self._samples
 
 		return geometric_median(samples, max_iterations=self._maxIterations, tolerance=self._tolerance)[:, np.newaxis]
 	
 	def messages(self, PEs_topology):
 
 		# the number of hops for each neighbour times the number of floats sent per message
-		return (self._distances[self.i_PE, self._i_relevant_PEs].sum() * state.n_elements_position) * self.n_particles
+		return (self._relevant_hops * state.n_elements_position) * self.n_particles
 
 
 class SinglePEMeansGeometricMedianWithinRadius(SinglePEGeometricMedian):
@@ -260,13 +302,25 @@ class SinglePEMeansGeometricMedianWithinRadius(SinglePEGeometricMedian):
 		# the selected PE is also included
 		self._i_relevant_PEs.append(self.i_PE)
 
+		# the number of hops from the selected PE to all the relevant ones
+		self._relevant_hops = self._distances[self.i_PE, self._i_relevant_PEs].sum()
+
+		# a buffer in which the mean of every relevant PE is written (one per row, so that every mean is contiguous)
+		self._means = np.empty((len(self._i_relevant_PEs), state.n_elements))
+
 	def estimate(self):
 
-		samples = np.hstack([self.DPF.PEs[iPE].compute_mean() for iPE in self._i_relevant_PEs])
+		# every relevant PE writes its mean straight into the corresponding row (no arrays need to be stacked)
+		for i, iPE in enumerate(self._i_relevant_PEs):
+
+			self.DPF.PEs[iPE].compute_mean(out=self._means[i][:, np.newaxis])
+
+		# one mean per column
+		samples = self._means.T
 
 		return geometric_median(samples, max_iterations=self._maxIterations, tolerance=self._tolerance)[:, np.newaxis]
 
 	def messages(self, PEs_topology):
 
 		# the number of hops for each neighbour times the number of floats sent per message
-		return self._distances[self.i_PE, self._i_relevant_PEs].sum() * state.n_elements_position
\ No newline at end of file
+		return self._relevant_hops * state.n_elements_position
\ No newline at end of file
@@ -1,9 +1,12 @@
 import collections
+import concurrent.futures
 import abc
 import colorama
 import numpy as np
 import scipy
 import sklearn.mixture
+import scipy.sparse
+import scipy.special
 import scipy.stats
 
 import state
@@ -18,6 +21,49 @@ NeighbourParticlesTuple = collections.namedtuple(
 	'NeighbourParticlesTuple', ['i_neighbour', 'i_particles'])
 
 
+def choice_without_replacement(population, k, PRNG):
+
+	"""Random subset (without replacement) of a population via a partial Fisher-Yates shuffle.
+
+	Only the first "k" positions of (a copy of) the population are shuffled, and hence the cost is O(k) random numbers
+	and swaps rather than the full permutation carried out by "PRNG.choice(..., replace=False)".
+
+	Parameters
+	----------
+	population : 1-D ndarray
+		The elements to choose from.
+	k : int
+		The number of elements to be drawn.
+	PRNG : RandomState
+		Pseudo random numbers generator.
+
+	Returns
+	-------
+	sample : 1-D ndarray
+		The selected elements.
+
+	"""
+
+	n = len(population)
+
+	if k > n:
+
+		raise Exception('cannot take a larger sample than the population when sampling without replacement')
+
+	population = population.copy()
+
+	# the i-th element is swapped with one chosen uniformly among those from the i-th onwards (array-valued bounds in
+	# "randint" are not supported by older versions of numpy)
+	i = np.arange(k)
+	i_swaps = i + (PRNG.random_sample(k) * (n - i)).astype(int)
+
+	for i, j in enumerate(i_swaps):
+
+		population[i], population[j] = population[j], population[i]
+
+	return population[:k]
+
+
 class ExchangeRecipe(metaclass=abc.ABCMeta):
 
 	def __init__(self, processing_elements_topology):
@@ -44,10 +90,25 @@ class ExchangeRecipe(metaclass=abc.ABCMeta):
 
 		return i_waking_PEs
 
+	@staticmethod
+	def random_neighbours(i_PEs, neighbourhoods, PRNG):
+
+		# a single batch of uniform random numbers is drawn to pick (uniformly) a neighbour for each one of the PEs
+		uniforms = PRNG.random_sample(len(i_PEs))
+
+		return [neighbourhoods[i][int(u * len(neighbourhoods[i]))] for i, u in zip(i_PEs, uniforms)]
+
 	def perform_exchange(self, DPF):
 
 		pass
 
+	def close(self):
+
+		"""It releases any resource (e.g., a thread pool) held by the exchange recipe.
+		"""
+
+		pass
+
 	def messages(self):
 
 		return np.NaN
@@ -81,6 +142,10 @@ class IteratedExchangeRecipe(ExchangeRecipe):
 
 			self._exchange_recipe.perform_exchange(DPF)
 
+	def close(self):
+
+		self._exchange_recipe.close()
+
 	@property
 	def n_processing_elements(self):
 
@@ -106,52 +171,95 @@ class ParticlesBasedExchangeRecipe(ExchangeRecipe):
 
 				# it is computed accounting for the maximum number of neighbours a given PE can have
 				self.n_particles_exchanged_between_neighbours = int(
-					(n_particles_per_processing_element * exchanged_particles) // max(
-						[len(neighbourhood) for neighbourhood in self.processing_elements_contacts]))
+					(n_particles_per_processing_element * exchanged_particles) //
+					max(map(len, self.processing_elements_contacts)))
 
 			else:
 
 				raise Exception('type of "exchanged_particles" is not valid')
 
-			if self.n_particles_exchanged_between_neighbours is 0:
+			if self.n_particles_exchanged_between_neighbours == 0:
 
 				raise Exception('no particles are to be shared by a PE with its processing_elements_contacts')
 
+			# the source and destination (PE and particle) of every copy involved in an exchange (see "set_exchanges")
+			self._i_destination_PEs = None
+
+			# the number of messages only depends on the (fixed) topology and neighbours, and hence it is computed once
+			self._n_messages = None
+
+	def set_exchanges(self, i_PEs, i_particles_within_PEs, i_neighbours, i_particles_within_neighbours):
+
+		# every exchange is expressed as two copies (to the PE and to the neighbour); these are interleaved so that,
+		# just like when the exchange tuples are processed one at a time, later tuples prevail over previous ones
+		self._i_destination_PEs = np.column_stack((i_PEs, i_neighbours)).ravel()
+		self._i_destination_particles = np.column_stack((i_particles_within_PEs, i_particles_within_neighbours)).ravel()
+		self._i_source_PEs = np.column_stack((i_neighbours, i_PEs)).ravel()
+		self._i_source_particles = np.column_stack((i_particles_within_neighbours, i_particles_within_PEs)).ravel()
+
+		# the indexes of the copies within the particles of all the PEs put together are computed in the first exchange
+		self._i_destination, self._i_source = None, None
+
 	def perform_exchange(self, DPF):
 
-		# first, we gather all the particles that are going to be exchanged in an auxiliar variable
-		aux = []
-		for exchangeTuple in self.exchange_tuples:
-			aux.append(
-				(DPF.PEs[exchangeTuple.i_PE].get_particle(exchangeTuple.i_particle_within_PE),
-				DPF.PEs[exchangeTuple.i_neighbour].get_particle(exchangeTuple.i_particle_within_neighbour)))
+		# if the exchanges have not been set yet, they are obtained from the exchange tuples
+		if self._i_destination_PEs is None:
 
-		# afterwards, we loop through all the exchange tuples performing the real exchange
-		for (exchangeTuple, particles) in zip(self.exchange_tuples, aux):
-			DPF.PEs[exchangeTuple.i_PE].set_particle(exchangeTuple.i_particle_within_PE, particles[1])
-			DPF.PEs[exchangeTuple.i_neighbour].set_particle(exchangeTuple.i_particle_within_neighbour, particles[0])
+			self.set_exchanges(*np.array(self.exchange_tuples, dtype=int).reshape(-1, 4).T)
 
-	def messages(self):
+		if self._i_destination is None:
 
-		# the number of hops between each pair of PEs
-		distances = self._PEs_topology.distances_between_processing_elements
+			# the position of the first particle of every PE when the particles of all of them are put together...
+			self._i_first_particles = np.cumsum([0] + [PE.n_particles for PE in DPF.PEs])
 
-		# overall number of messages sent/received in an exchange step
-		n_messages = 0
+			# ...is used to turn every (PE, particle) pair into a single index
+			self._i_destination = self._i_first_particles[self._i_destination_PEs] + self._i_destination_particles
+			self._i_source = self._i_first_particles[self._i_source_PEs] + self._i_source_particles
 
-		# for every PE (index) along with its list of neighbours
-		for i_processing_element, neighbours_list in enumerate(self.neighbours_particles):
+			# if a particle can be exchanged more than once, several copies might share a destination: only the last one
+			# is kept (the first one in reversed order), and the destinations come out sorted so that the particles of
+			# every PE are written back-to-back
+			self._i_destination, i_last_copies = np.unique(self._i_destination[::-1], return_index=True)
+			self._i_source = self._i_source[::-1][i_last_copies]
 
-			# each element of the list is a tuple (<index neighbour>,<indexes of the particles exchanged with that neighbour>)
-			for i_neighbour, i_particles in neighbours_list:
+		# the samples and log-weights of all the PEs are gathered (if the DPF keeps them in shared arrays, these are
+		# the arrays themselves, and the exchange happens in place)...
+		samples = DPF.get_state()
+		log_weights = DPF.get_log_weights()
 
-				# the number of messages required to send the samples
-				n_messages += distances[i_processing_element, i_neighbour]*len(i_particles)*state.n_elements
+		# ...and every exchange is carried out at once
+		samples[:, self._i_destination] = samples[:, self._i_source]
+		log_weights[self._i_destination] = log_weights[self._i_source]
 
-			# we also need to send the aggregated weight to each neighbour
-			n_messages += len(neighbours_list)
+		for PE, i_first, i_last in zip(DPF.PEs, self._i_first_particles[:-1], self._i_first_particles[1:]):
 
-		return n_messages
+			# every PE gets back its (updated) particles, unless they already live within the above arrays
+			if not np.may_share_memory(PE.samples, samples):
+
+				PE.samples = samples[:, i_first:i_last]
+				PE.log_weights = log_weights[i_first:i_last]
+
+			# the sum of the weights might have changed...
+			PE.update_aggregated_weight()
+
+	def messages(self):
+
+		if self._n_messages is None:
+
+			# the number of hops between each pair of PEs
+			distances = self._PEs_topology.distances_between_processing_elements
+
+			# every tuple (<index neighbour>,<indexes of the particles exchanged with that neighbour>) in the list of
+			# every PE is flattened into the index of the PE, that of the neighbour, and the number of particles
+			i_PEs, i_neighbours, n_particles = np.array([
+				(i_processing_element, i_neighbour, len(i_particles))
+				for i_processing_element, neighbours_list in enumerate(self.neighbours_particles)
+				for i_neighbour, i_particles in neighbours_list], dtype=int).reshape(-1, 3).T
+
+			# the number of messages required to send the samples, plus the aggregated weight sent to each neighbour
+			self._n_messages = (distances[i_PEs, i_neighbours]*n_particles).sum()*state.n_elements + len(i_PEs)
+
+		return self._n_messages
 
 	@abc.abstractmethod
 	def get_PEs_contacts(self):
@@ -180,75 +288,106 @@ class DRNAExchangeRecipe(ParticlesBasedExchangeRecipe):
 		# indexes of the particles...just for the sake of efficiency (this array will be used many times)
 		i_particles = np.arange(n_particles_per_processing_element)
 
-		# an array to keep tabs on pairs of PEs already processed
-		already_processed_PEs = np.zeros((self._n_PEs, self._n_PEs), dtype=bool)
+		# a set to keep tabs on pairs of PEs already processed (every pair is stored as (<lower index>,<higher index>))
+		already_processed_PEs = set()
+
+		# the number of particles every PE exchanges with each one of its neighbours
+		n_exchanged = self.n_particles_exchanged_between_neighbours
+
+		# the index of the PE and that of the neighbour for every pair of PEs exchanging particles
+		i_PEs, i_neighbours = [], []
+
+		for iPE, i_this_PE_neighbours in enumerate(self.processing_elements_contacts):
+
+			for iNeighbour in i_this_PE_neighbours:
+
+				# the pair in canonical order
+				PEs_pair = (min(iPE, iNeighbour), max(iPE, iNeighbour))
+
+				if PEs_pair not in already_processed_PEs:
 
-		# in order to keep tabs on which particles a given PE has already "promised" to exchange
-		particles_not_swapped_yet = np.ones((self._n_PEs, n_particles_per_processing_element), dtype=bool)
+					i_PEs.append(iPE)
+					i_neighbours.append(iNeighbour)
 
-		# all the elements in this array will be "true" across all the iterations of the loop below
-		candidate_particles_all_true = particles_not_swapped_yet.copy()
+					# we "mark" this pair of PEs as already processed
+					already_processed_PEs.add(PEs_pair)
+
+		i_PEs = np.array(i_PEs, dtype=int)
+		i_neighbours = np.array(i_neighbours, dtype=int)
+
+		# the particles to be exchanged are chosen randomly (with no replacement) for both, the PE and the neighbour in
+		# every pair (in that order), and hence the PEs drawing particles are...
+		i_drawing_PEs = np.column_stack((i_PEs, i_neighbours)).ravel()
 
 		if allow_exchange_one_particle_more_than_once:
 
-			# the "reference" below is set to a fixed all-true array
-			candidate_particles = candidate_particles_all_true
+			# every PE draws the particles to be exchanged with each neighbour among all of its particles
+			i_exchanged_particles = np.array(
+				[choice_without_replacement(i_particles, n_exchanged, PRNG) for _ in i_drawing_PEs],
+				dtype=int).reshape(-1, n_exchanged)
 
 		else:
 
-			# the "reference" is set to the (varying) "particles_not_swapped_yet"
-			candidate_particles = particles_not_swapped_yet
+			# a random permutation of the particles of every PE is computed once, and consecutive slices of it are
+			# handed out to the successive neighbours, which guarantees a particle is never "promised" twice...
+			permutations = np.array(
+				[PRNG.permutation(n_particles_per_processing_element) for _ in range(self._n_PEs)], dtype=int)
 
-		# named tuples as defined above, each representing an exchange
-		self._exchangeTuples = []
+			# ...the slice for every draw being given by the number of previous draws of the same PE (a stable sort
+			# preserves the order of the draws of every PE)
+			i_sorted_draws = np.argsort(i_drawing_PEs, kind='stable')
+			sorted_drawing_PEs = i_drawing_PEs[i_sorted_draws]
+			i_slices = np.empty_like(i_drawing_PEs)
+			i_slices[i_sorted_draws] = np.arange(len(sorted_drawing_PEs)) - np.searchsorted(
+				sorted_drawing_PEs, sorted_drawing_PEs)
 
-		# a list in which the i-th element is also a list containing tuples of the form (<neighbour index>,<numpy array>
-		#  with the indices of particles to be exchanged with that neighbour>)
-		self._neighbours_particles = [[] for _ in range(self._n_PEs)]
+			if len(i_slices) > 0 and (i_slices.max() + 1) * n_exchanged > n_particles_per_processing_element:
 
-		for iPE, i_this_PE_neighbours in enumerate(self.processing_elements_contacts):
+				raise Exception('PE {} does not have enough particles to exchange with every neighbour'.format(
+					i_drawing_PEs[i_slices.argmax()]))
 
-			for iNeighbour in i_this_PE_neighbours:
+			i_exchanged_particles = permutations[
+				i_drawing_PEs[:, np.newaxis], i_slices[:, np.newaxis] * n_exchanged + np.arange(n_exchanged)]
 
-				if not already_processed_PEs[iPE, iNeighbour]:
+		# the particles exchanged by the PE and the neighbour in every pair (one row per pair)
+		i_particles_within_PEs = i_exchanged_particles[0::2]
+		i_particles_within_neighbours = i_exchanged_particles[1::2]
 
-					# the particles to be exchanged are chosen randomly (with no replacement) for both, this PE...
-					i_exchanged_particles_within_PE = PRNG.choice(
-						i_particles[candidate_particles[iPE, :]],
-						size=self.n_particles_exchanged_between_neighbours, replace=False)
+		# a list in which the i-th element is also a list containing tuples of the form (<neighbour index>,<numpy array>
+		#  with the indices of particles to be exchanged with that neighbour>)
+		self._neighbours_particles = [[] for _ in range(self._n_PEs)]
 
-					# ...and the corresponding neighbour
-					i_exchanged_particles_within_neighbour = PRNG.choice(
-						i_particles[candidate_particles[iNeighbour, :]],
-						size=self.n_particles_exchanged_between_neighbours, replace=False)
+		for iPE, iNeighbour, i_exchanged_particles_within_PE, i_exchanged_particles_within_neighbour in zip(
+				i_PEs.tolist(), i_neighbours.tolist(), i_particles_within_PEs, i_particles_within_neighbours):
 
-					# new "exchange tuple"s are generated
-					self._exchangeTuples.extend([ExchangeTuple(
-						i_PE=iPE, i_particle_within_PE=iParticleWithinPE, i_neighbour=iNeighbour,
-						i_particle_within_neighbour=iParticleWithinNeighbour
-					) for iParticleWithinPE, iParticleWithinNeighbour in zip(
-						i_exchanged_particles_within_PE, i_exchanged_particles_within_neighbour)])
+			# each tuple specifies a neighbor, and the particles THE LATTER exchanges with it (rather than the other way
+			# around)
+			self._neighbours_particles[iPE].append(
+				NeighbourParticlesTuple(iNeighbour, i_exchanged_particles_within_neighbour))
 
-					# these PEs (the one considered in the main loop and the neighbour being processed) should not
-					# exchange the selected particles (different in each case) with other PEs
-					particles_not_swapped_yet[iPE, i_exchanged_particles_within_PE] = False
-					particles_not_swapped_yet[iNeighbour, i_exchanged_particles_within_neighbour] = False
+			self._neighbours_particles[iNeighbour].append(NeighbourParticlesTuple(iPE, i_exchanged_particles_within_PE))
 
-					# we "mark" this pair of PEs as already processed; despite the symmetry,
-					# only "already_processed_PEs[iNeighbour, iPe]" should be accessed later on
-					already_processed_PEs[iNeighbour, iPE] = already_processed_PEs[iPE, iNeighbour] = True
+		# the fields of the exchanges as arrays (one element per exchanged pair of particles)...
+		i_PEs = np.repeat(i_PEs, n_exchanged)
+		i_neighbours = np.repeat(i_neighbours, n_exchanged)
+		i_particles_within_PEs = i_particles_within_PEs.ravel()
+		i_particles_within_neighbours = i_particles_within_neighbours.ravel()
 
-					# each tuple specifies a neighbor, and the particles THE LATTER exchanges with it (rather than
-					# the other way around)
-					self._neighbours_particles[iPE].append(
-						NeighbourParticlesTuple(iNeighbour, i_exchanged_particles_within_neighbour))
+		# ...are kept, since the exchange tuples are only built (from them) if requested...
+		self._exchanges = (i_PEs, i_particles_within_PEs, i_neighbours, i_particles_within_neighbours)
+		self._exchangeTuples = None
 
-					self._neighbours_particles[iNeighbour].append(
-						NeighbourParticlesTuple(iPE, i_exchanged_particles_within_PE))
+		# ...and are used to express every exchange as a couple of copies
+		self.set_exchanges(*self._exchanges)
 
 	@property
 	def exchange_tuples(self):
 
+		if self._exchangeTuples is None:
+
+			# named tuples as defined above, each representing an exchange
+			self._exchangeTuples = list(map(ExchangeTuple._make, zip(*[a.tolist() for a in self._exchanges])))
+
 		return self._exchangeTuples
 
 	# this is only meant to be used by subclasses (specifically, Mposterior-related ones)
@@ -275,7 +414,8 @@ class MposteriorExchangeRecipe(DRNAExchangeRecipe):
 
 	def __init__(
 			self, processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
-			weiszfeld_parameters, PRNG=np.random.RandomState(), allow_exchange_one_particle_more_than_once=False):
+			weiszfeld_parameters, PRNG=np.random.RandomState(), allow_exchange_one_particle_more_than_once=False,
+			n_threads=1):
 
 		super().__init__(processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
 			PRNG, allow_exchange_one_particle_more_than_once)
@@ -286,29 +426,129 @@ class MposteriorExchangeRecipe(DRNAExchangeRecipe):
 			n_particles_per_processing_element, size=self.n_particles_exchanged_between_neighbours
 		) for _ in range(self._n_PEs)]
 
+		# if requested, the M-posteriors of the different PEs are computed concurrently (see "perform_exchange")
+		self._thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) if n_threads > 1 else None
+
+		# the layout of the subset posteriors of every PE within the samples of all the PEs (see "set_subsets")
+		self._i_subsets_samples = None
+
+	def set_subsets(self, DPF):
+
+		# the position of the first particle of every PE when the particles of all of them are put together
+		self._i_first_particles = np.cumsum([0] + [PE.n_particles for PE in DPF.PEs])
+
+		# for every PE, the columns (within the samples of all the PEs) of the particles making up its subset
+		# posteriors, and the boundaries between the latter
+		self._i_subsets_samples, self._subsets_boundaries = [], []
+
+		for i_PE, (this_PE_neighbours_particles, i_this_PE_particles) in enumerate(
+				zip(self.neighbours_particles, self.i_own_particles_within_PEs)):
+
+			# a subset posterior for each neighbour, and another one from this PE
+			i_samples = [
+				self._i_first_particles[neighbour_particles.i_neighbour] + neighbour_particles.i_particles
+				for neighbour_particles in this_PE_neighbours_particles] + [
+				self._i_first_particles[i_PE] + i_this_PE_particles]
+
+			self._i_subsets_samples.append(np.concatenate(i_samples))
+			self._subsets_boundaries.append(np.cumsum([len(i) for i in i_samples])[:-1])
+
+		# PEs are updated in order, and the M-posterior of a PE can be computed as soon as every preceding PE whose
+		# particles it takes has been updated: the m-th element of this list holds the PEs for which the first m PEs
+		# must have been updated (and no more)
+		self._i_PEs_ready = [[] for _ in range(self._n_PEs + 1)]
+
+		for i_PE, i_subsets_samples in enumerate(self._i_subsets_samples):
+
+			# the PEs (preceding this one) that own any of the particles in the subset posteriors
+			i_source_PEs = np.searchsorted(self._i_first_particles, i_subsets_samples, side='right') - 1
+			i_preceding_source_PEs = i_source_PEs[i_source_PEs < i_PE]
+
+			self._i_PEs_ready[i_preceding_source_PEs.max() + 1 if i_preceding_source_PEs.size else 0].append(i_PE)
+
+	def subset_posterior_distributions(self, samples, i_PE):
+
+		# the particles of all the subset posteriors of this PE are gathered at once, and then split (into views)
+		return np.split(samples[:, self._i_subsets_samples[i_PE]].T, self._subsets_boundaries[i_PE])
+
+	@staticmethod
+	def update_PE(DPF, PE, joint_particles, joint_weights):
+
+		# the indexes of the particles to be kept
+		i_new_particles = DPF._resampling_algorithm.get_indexes(joint_weights, PE.n_particles)
+
+		# the selected particles are gathered straight into the array holding the samples of the PE
+		np.take(joint_particles, i_new_particles, axis=1, out=PE.samples)
+
+		# the (uniform) weights are written in place rather than allocating a new array for every PE
+		PE.log_weights.fill(-np.log(PE.n_particles))
+		PE.update_aggregated_weight()
+
 	def perform_exchange(self, DPF):
 
-		for PE, this_PE_neighbours_particles, i_this_PE_particles in zip(
-				DPF.PEs, self.neighbours_particles, self.i_own_particles_within_PEs):
+		# the subset posteriors are laid out the first time an exchange is carried out
+		if self._i_subsets_samples is None:
 
-			# a list with the subset posterior of each neighbour
-			subset_posterior_distributions = [
-				DPF.PEs[neighbour_particles.i_neighbour].get_samples_at(neighbour_particles.i_particles).T
-				for neighbour_particles in this_PE_neighbours_particles]
+			self.set_subsets(DPF)
 
-			# a subset posterior obtained from this PE is also added: it encompasses
-			# the particles whose indexes are given in "i_this_PE_particles"
-			subset_posterior_distributions.append(PE.get_samples_at(i_this_PE_particles).T)
+		# the samples of all the PEs put together
+		samples = DPF.get_state()
 
-			joint_particles, joint_weights = mposterior.find_weiszfeld_median(
-					subset_posterior_distributions, **self.weiszfeld_parameters)
+		# every PE is updated (in order) right after computing its M-posterior, and hence the PEs processed later might
+		# get particles from neighbours that have already been updated
+		if self._thread_pool is None:
 
-			# the indexes of the particles to be kept
-			i_new_particles = DPF._resampling_algorithm.get_indexes(joint_weights, PE.n_particles)
+			for i_PE, PE in enumerate(DPF.PEs):
 
-			PE.samples = joint_particles[:, i_new_particles]
-			PE.log_weights = np.full(PE.n_particles, -np.log(PE.n_particles))
-			PE.update_aggregated_weight()
+				joint_particles, joint_weights = mposterior.find_weiszfeld_median(
+					self.subset_posterior_distributions(samples, i_PE), **self.weiszfeld_parameters)
+
+				self.update_PE(DPF, PE, joint_particles, joint_weights)
+
+				# the new particles of this PE must be available to those processed later (unless they were written
+				# within the above array)
+				if not np.may_share_memory(PE.samples, samples):
+
+					samples[:, self._i_first_particles[i_PE]:self._i_first_particles[i_PE + 1]] = PE.samples
+
+		# the PEs are updated in the very same order (which also keeps the draws from the shared PRNG in the same
+		# order), but the M-posterior of every PE is computed within the thread pool as soon as the particles it takes
+		# are final, and hence several of them might be in progress at the same time
+		else:
+
+			M_posteriors = [None] * self._n_PEs
+
+			# those not taking particles from any PE to be updated earlier are computed right away
+			self.submit_M_posteriors(samples, self._i_PEs_ready[0], M_posteriors)
+
+			for i_PE, PE in enumerate(DPF.PEs):
+
+				joint_particles, joint_weights = M_posteriors[i_PE].result()
+
+				self.update_PE(DPF, PE, joint_particles, joint_weights)
+
+				if not np.may_share_memory(PE.samples, samples):
+
+					samples[:, self._i_first_particles[i_PE]:self._i_first_particles[i_PE + 1]] = PE.samples
+
+				# those only waiting for this PE to be updated can now be computed
+				self.submit_M_posteriors(samples, self._i_PEs_ready[i_PE + 1], M_posteriors)
+
+	def close(self):
+
+		# the threads (if any) in which the M-posteriors are computed are shut down
+		if self._thread_pool is not None:
+
+			self._thread_pool.shutdown()
+
+	def submit_M_posteriors(self, samples, i_PEs, M_posteriors):
+
+		for i_PE in i_PEs:
+
+			# the subset posteriors are gathered (copied) right away, before any other PE is updated
+			M_posteriors[i_PE] = self._thread_pool.submit(
+				mposterior.find_weiszfeld_median, self.subset_posterior_distributions(samples, i_PE),
+				**self.weiszfeld_parameters)
 
 	def messages(self):
 
@@ -327,7 +567,8 @@ class MposteriorWithinRadiusExchangeRecipe(MposteriorExchangeRecipe):
 
 	def __init__(
 			self, processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
-			weiszfeld_parameters, radius, PRNG=np.random.RandomState(), allow_exchange_one_particle_more_than_once=False):
+			weiszfeld_parameters, radius, PRNG=np.random.RandomState(), allow_exchange_one_particle_more_than_once=False,
+			n_threads=1):
 
 		# this needs to be set before super() because the ancestor class "__init__" depends on "get_PEs_contacts" which,
 		#  in turn, depends on radius
@@ -335,7 +576,7 @@ class MposteriorWithinRadiusExchangeRecipe(MposteriorExchangeRecipe):
 
 		super().__init__(
 				processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
-				weiszfeld_parameters, PRNG, allow_exchange_one_particle_more_than_once)
+				weiszfeld_parameters, PRNG, allow_exchange_one_particle_more_than_once, n_threads)
 
 	def get_PEs_contacts(self):
 
@@ -346,13 +587,13 @@ class SameParticlesMposteriorWithinRadiusExchangeRecipe(MposteriorWithinRadiusEx
 
 	def __init__(
 			self, processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
-			weiszfeld_parameters, radius, PRNG=np.random.RandomState()):
+			weiszfeld_parameters, radius, PRNG=np.random.RandomState(), n_threads=1):
 
 		# "allow_exchange_one_particle_more_than_once" is set to true since it is irrelevant here, but could cause the
 		# parent class to throw an exception if set to False
 		super().__init__(
 				processing_elements_topology, n_particles_per_processing_element, exchanged_particles,
-				weiszfeld_parameters, radius, PRNG, allow_exchange_one_particle_more_than_once=True)
+				weiszfeld_parameters, radius, PRNG, allow_exchange_one_particle_more_than_once=True, n_threads=n_threads)
 
 		i_particles_shared_by_each_PE = [
 			PRNG.choice(n_particles_per_processing_element, size=self.n_particles_exchanged_between_neighbours, replace=False)
@@ -388,84 +629,86 @@ class LikelihoodConsensusExchangeRecipe(ExchangeRecipe):
 		# a list of lists in which each element yields the neighbors of a PE
 		self._neighborhoods = processing_elements_topology.get_neighbours()
 
+		# the length of subset of the state on which the likelihood depends
+		M = 2
+
+		# theoretically, this is the number of beta components that should result
+		self._n_consensus_algorithms = scipy.special.comb(
+			2*self.polynomial_degree + M, 2*self.polynomial_degree, exact=True) - 1
+
+		# overall number of neighbours: #neighbours of the 1st PE + #neighbours of the 2nd PE +...
+		self._n_neighbours = sum([len(neighbours) for neighbours in self._neighborhoods])
+
 		# Metropolis weights
 		# ==========================
 
-		# this will store tuples (<own weight>,<numpy array with weights for each neighbor>)
-		self._metropolis_weights = []
+		# the number of neighbours of every PE
+		n_neighbours_PEs = np.array([len(neighbours) for neighbours in self._neighborhoods], dtype=int)
 
-		# for the neighbours of every PE
-		for neighbors in self._neighborhoods:
+		# every (PE, neighbour) pair in one go: the weight assigned to a neighbour depends on the number of neighbours
+		# of both the PE and the neighbour itself
+		i_PEs = np.repeat(np.arange(self._n_PEs), n_neighbours_PEs)
+		i_neighbours = np.concatenate([np.array(neighbours, dtype=int) for neighbours in self._neighborhoods])
+		neighbours_weights = 1/(1 + np.maximum(n_neighbours_PEs[i_PEs], n_neighbours_PEs[i_neighbours]))
 
-			# the number of neighbors of the PE
-			n_neighbors = len(neighbors)
+		# a (sparse) matrix whose i-th row contains the weights used by the i-th PE for its neighbours...
+		neighbours_weights_matrix = scipy.sparse.csr_matrix(
+			(neighbours_weights, (i_PEs, i_neighbours)), shape=(self._n_PEs, self._n_PEs))
 
-			# the weight assigned to each one of its neighbors
-			neighbors_weights = np.array(
-				[1/(1+max(n_neighbors, len(self._neighborhoods[i_neighbour]))) for i_neighbour in neighbors])
+		# ...and the weight every PE assigns to itself
+		own_weights = 1 - neighbours_weights_matrix.sum(axis=1).A1
 
-			# the weight assigned to itself is the first element in the tuple
-			self._metropolis_weights.append((1-neighbors_weights.sum(), neighbors_weights))
+		# all the weights (the i-th row contains the weights used by the i-th PE)
+		self._metropolis_weights_matrix = (neighbours_weights_matrix + scipy.sparse.diags(own_weights)).tocsr()
 
-	def perform_exchange(self, DPF):
+		# tuples (<own weight>,<numpy array with weights for each neighbor>) for the PE-by-PE iterations
+		self._metropolis_weights = list(zip(
+			own_weights, np.split(neighbours_weights, np.cumsum(n_neighbours_PEs)[:-1])))
 
-		# the first iteration of the consensus algorithm
-		# ==========================
+		# the neighbours of every PE as an array of indexes (views of a single one) so that they are not converted at
+		# every iteration
+		self._neighbours_indexes = np.split(i_neighbours, np.cumsum(n_neighbours_PEs)[:-1])
 
-		# for every PE, along with its neighbours
-		for PE, neighbours, weights in zip(DPF.PEs, self._neighborhoods, self._metropolis_weights):
+	def perform_exchange(self, DPF):
 
-			# a dictionary for storing the "consensed" beta's
-			PE.betaConsensus = {}
+		# the beta's of every PE (one per row) for every combination of exponents, r (one per column)
+		betas = np.array([PE.beta for PE in DPF.PEs])
 
-			# for every combination of exponents, r
-			for r in DPF._r_d_tuples:
+		# the first iteration of the consensus algorithm
+		# ==========================
 
-				PE.betaConsensus[r] = PE.beta[r]*weights[0] + np.array(
-					[DPF.PEs[i_neighbour].beta[r] for i_neighbour in neighbours]).dot(weights[1])
+		# only the original beta's are involved, and hence all the PEs are updated at once
+		betas_consensus = self._metropolis_weights_matrix @ betas
 
 		# the remaining iterations of the consensus algorithm
 		# ==========================
 
-		# the same operations as above using "betaConsensus" rather than beta
+		# every PE uses the "consensed" beta's of its neighbours as they stand (some may have already been updated in
+		# this very iteration), and hence PEs are processed one at a time...but every r is processed at once
 		for _ in range(self._max_iterations-1):
 
 			# for every PE, along with its neighbours
-			for PE, neighbours, weights in zip(DPF.PEs, self._neighborhoods, self._metropolis_weights):
+			for i_PE, (neighbours, weights) in enumerate(zip(self._neighbours_indexes, self._metropolis_weights)):
 
-				# for every combination of exponents, r
-				for r in DPF._r_d_tuples:
-
-					PE.betaConsensus[r] = PE.betaConsensus[r]*weights[0] + np.array(
-						[DPF.PEs[i_neighbour].betaConsensus[r] for i_neighbour in neighbours]).dot(weights[1])
+				betas_consensus[i_PE] = betas_consensus[i_PE]*weights[0] + weights[1] @ betas_consensus[neighbours]
 
 		# every average is turned into a sum
 		# ==========================
 
-		# for every PE...
-		for PE in DPF.PEs:
+		betas_consensus *= self._n_PEs
 
-			# ...and every coefficient computed
-			for r in DPF._r_d_tuples:
+		# every PE gets an array with its "consensed" beta's (in the same order as the original ones)
+		for PE, PE_betas_consensus in zip(DPF.PEs, betas_consensus):
 
-				PE.betaConsensus[r] *= self._n_PEs
+			PE.betaConsensus = PE_betas_consensus
 
 	def messages(self):
 
-		# the length of subset of the state on which the likelihood depends
-		M = 2
-
-		# theoretically, this is the number of beta components that should result
-		n_consensus_algorithms = scipy.misc.comb(2*self.polynomial_degree + M, 2*self.polynomial_degree, exact=True) - 1
-
-		# overall number of neighbours: #neighbours of the 1st PE + #neighbours of the 2nd PE +...
-		n_neighbours = sum([len(neighbours) for neighbours in self._neighborhoods])
-
 		# each PE sends "n_consensus_algorithms" values to each one of its neighbours, once per iteration...
-		n_messages = n_neighbours*n_consensus_algorithms*self._max_iterations
+		n_messages = self._n_neighbours*self._n_consensus_algorithms*self._max_iterations
 
 		# ...additionally it needs to send each neighbour the number of neighbours it has itself (Metropolis weights)
-		n_messages += n_neighbours
+		n_messages += self._n_neighbours
 
 		return n_messages
 
@@ -501,12 +744,13 @@ class GaussianExchangeRecipe(ExchangeRecipe):
 
 	def perform_exchange(self, DPF):
 
-		# indexes of the PEs that will wake up during this exchange
+		# indexes of the PEs that will wake up during this exchange...
 		i_waking_PEs = self.randomized_wakeup(self.n_iterations, self._PRNG)
 
-		for i_PE in i_waking_PEs:
+		# ...and of the neighbours they select
+		i_selected_neighbors = self.random_neighbours(i_waking_PEs, self._PEs_neighbors, self._PRNG)
 
-			i_selected_neighbor = self._PRNG.choice(self._PEs_neighbors[i_PE])
+		for i_PE, i_selected_neighbor in zip(i_waking_PEs, i_selected_neighbors):
 
 			# average of the Qs
 			DPF.PEs[i_PE]._Q = DPF.PEs[i_selected_neighbor]._Q\
@@ -766,13 +1010,13 @@ class SelectiveGossipExchangeRecipe(ExchangeRecipe):
 		# for every PE, a list with the indexes of the significant values *according to that PE*
 		PEs_i_significant = [[]] * self._n_PEs
 
-		# indexes of the nodes to be wakened during this gossip operation
+		# indexes of the nodes to be wakened during this gossip operation...
 		i_nodes_to_be_wakened = self.randomized_wakeup(self._n_iterations_selective_gossip, self._PRNG)
 
-		for i in i_nodes_to_be_wakened:
+		# ...and those of the neighbors they select
+		i_selected_neighbors = self.random_neighbours(i_nodes_to_be_wakened, self._neighborhoods, self._PRNG)
 
-			# index of the selected neighbor
-			i_neigh = self._PRNG.choice(self._neighborhoods[i])
+		for i, i_neigh in zip(i_nodes_to_be_wakened, i_selected_neighbors):
 
 			# for the sake of convenience
 			i_involved_PEs = [i, i_neigh]
@@ -794,13 +1038,13 @@ class SelectiveGossipExchangeRecipe(ExchangeRecipe):
 
 		# ---------------------- MAX Gossip ------------------------
 
-		# indexes of the nodes to be wakened during this gossip operation
+		# indexes of the nodes to be wakened during this gossip operation...
 		i_nodes_to_be_wakened = self.randomized_wakeup(self._n_iterations_max_gossip, self._PRNG)
 
-		for i in i_nodes_to_be_wakened:
+		# ...and those of the neighbors they select
+		i_selected_neighbors = self.random_neighbours(i_nodes_to_be_wakened, self._neighborhoods, self._PRNG)
 
-			# index of the selected neighbor
-			i_neigh = self._PRNG.choice(self._neighborhoods[i])
+		for i, i_neigh in zip(i_nodes_to_be_wakened, i_selected_neighbors):
 
 			# for the sake of convenience
 			i_involved_PEs = [i, i_neigh]
@@ -6,6 +6,7 @@ import scipy.stats
 import colorama
 
 import state
+import smc.resampling
 from smc.particle_filter.particle_filter import ParticleFilter
 import sensor as sensor_module
 
@@ -16,12 +17,39 @@ class TargetTrackingParticleFilter(ParticleFilter):
 
 	def __init__(
 			self, n_particles, resampling_algorithm, resampling_criterion, prior, state_transition_kernel, sensors,
-			aggregated_weight=1.0):
+			aggregated_weight=1.0, samples_buffer=None, log_weights_buffer=None, log_aggregated_weight_buffer=None):
 
 		super().__init__(n_particles, resampling_algorithm, resampling_criterion)
 
+		# if the resampling criterion can work with log-weights, whether resampling is needed is checked without
+		# exponentiating them (see "resample")
+		self._is_resampling_needed_from_log_weights = resampling_criterion.is_resampling_needed_from_log_weights \
+			if isinstance(resampling_criterion, smc.resampling.LogWeightsResamplingCriterion) else None
+
+		# likewise, if the resampling algorithm can work with log-weights, the particles to be kept are drawn from them
+		self._get_indexes_from_log_weights = resampling_algorithm.get_indexes_from_log_weights \
+			if isinstance(resampling_algorithm, smc.resampling.LogWeightsResamplingAlgorithm) else None
+
+		# if buffers are received (e.g., views of arrays shared by several PFs), the samples, log-weights and (log)
+		# aggregated weight are always written into them rather than in newly allocated arrays
+		self._samples_buffer = samples_buffer
+		self._log_weights_buffer = log_weights_buffer
+
+		# the aggregated weight is always kept in a one-element array (see "_log_aggregated_weight")
+		self._log_aggregated_weight_buffer = np.full(1, np.nan) if log_aggregated_weight_buffer is None \
+			else log_aggregated_weight_buffer
+
 		# a vector with the weights is created...but not initialized (that must be done by the "initialize" method)
-		self._log_weights = np.empty(n_particles)
+		self._log_weights = np.empty(n_particles) if log_weights_buffer is None else log_weights_buffer
+
+		# the sensors are kept
+		self._sensors = copy.deepcopy(sensors)
+
+		# a buffer in which the likelihoods of every particle for every sensor are computed at each time instant...
+		self._likelihoods = np.empty((len(self._sensors), n_particles))
+
+		# ...and another one for the (natural units) weights used when computing the mean or resampling
+		self._weights_buffer = np.empty(n_particles)
 
 		# the state equation is encoded in the transition kernel
 		self._state_transition_kernel = state_transition_kernel
@@ -29,9 +57,6 @@ class TargetTrackingParticleFilter(ParticleFilter):
 		# the prior is needed to initialize the state
 		self._prior = prior
 
-		# the sensors are kept
-		self._sensors = copy.deepcopy(sensors)
-
 		# EVERY time this PF is initialized, the aggregated weight is set to this value
 		self._initial_aggregated_weight = aggregated_weight
 
@@ -39,29 +64,27 @@ class TargetTrackingParticleFilter(ParticleFilter):
 
 		# these will get set as soon as the "initialize" method gets called
 		self._state = None
-		self._log_aggregated_weight = None
 		self._loglikelihoods_product = None
 
+		# the normalized weights are only computed (from the log-weights) when requested, and kept until the latter change
+		self._normalized_weights = None
+
 		# TODO: this class and its children should receive a *sensorsArray* object
-		if isinstance(sensors[0], sensor_module.RSSsensor):
-			self._sensors_array = sensor_module.RSSsensorsArray(self._sensors)
-		elif isinstance(sensors[0], sensor_module.BinarySensor):
-			self._sensors_array = sensor_module.BinarySensorsArray(self._sensors)
-		else:
-			raise Exception('an array of this type of sensor is not supported')
+		self._sensors_array = sensor_module.build_sensors_array(self._sensors)
 
 	# this should be called whenever any of the sensors within the PF are modified
 	def reset_sensors_array(self):
 
-		self._sensors_array = sensor_module.RSSsensorsArray(self._sensors)
+		self._sensors_array = sensor_module.build_sensors_array(self._sensors)
 
 	def initialize(self):
 
 		# initial samples...
-		self._state = self._prior.sample(self._n_particles)
+		self.set_state(self._prior.sample(self._n_particles))
 
 		# the weights are assigned equal probabilities
 		self._log_weights.fill(self._log_initial_aggregated_weight - np.log(self._n_particles))
+		self._normalized_weights = None
 
 		self._log_aggregated_weight = self._log_initial_aggregated_weight
 
@@ -70,7 +93,7 @@ class TargetTrackingParticleFilter(ParticleFilter):
 		assert len(observations) == len(self._sensors)
 
 		# every particle is updated (previous state is not stored...)
-		self._state = self._state_transition_kernel.next_state(self._state)
+		self.set_state(self._state_transition_kernel.next_state(self._state))
 
 		# FIXME: this code is needed if the sensor is not RSS
 		# # for each sensor, we compute the likelihood of EVERY particle (position)
@@ -78,13 +101,9 @@ class TargetTrackingParticleFilter(ParticleFilter):
 		# 	[sensor.likelihood(obs, state.to_position(self._state)) for sensor, obs in
 		# 	 zip(self._sensors, observations)])
 
-		# for EVERY sensor, we compute the likelihood of EVERY particle (position)
-		likelihoods = self._sensors_array.likelihood(observations, state.to_position(self._state))
-
-		# in order to avoid floating point arithmetic issues
-		likelihoods += 1e-200
-
-		loglikelihoods = np.log(likelihoods)
+		# for EVERY sensor, we compute the log-likelihood of EVERY particle (position) directly in the log domain
+		loglikelihoods = self._sensors_array.log_likelihood(
+			observations, state.to_position(self._state), out=self._likelihoods)
 
 		# for each particle, we compute the product of the likelihoods for all the sensors
 		self._loglikelihoods_product = loglikelihoods.sum(axis=0)
@@ -100,30 +119,71 @@ class TargetTrackingParticleFilter(ParticleFilter):
 
 	def resample(self, normalized_log_weights):
 
-		# the weights need to be converted to "natural" units
-		normalized_weights = np.exp(normalized_log_weights)
+		# if the criterion can work with log-weights, whether resampling is needed is checked before exponentiating them
+		if self._is_resampling_needed_from_log_weights is not None:
 
-		# we check whether a resampling step is actually needed or not
-		if self._resampling_criterion.is_resampling_needed(normalized_weights):
+			if not self._is_resampling_needed_from_log_weights(normalized_log_weights):
 
-			try:
-				# the resampling algorithm is used to decide which particles to keep
-				i_particles_to_be_kept = self._resampling_algorithm.get_indexes(normalized_weights)
+				return
 
-			except ValueError:
+			# they are only converted to "natural" units (below) if the resampling algorithm needs them
+			normalized_weights = None
 
-				# this should mean the normalized weights don't add up EXACTLY to one...we renormalize them...
-				normalized_weights /= normalized_weights.sum()
+		else:
+
+			normalized_weights = self.weights_from_log_weights(normalized_log_weights)
+
+			# we check whether a resampling step is actually needed or not
+			if not self._resampling_criterion.is_resampling_needed(normalized_weights):
+
+				return
+
+		# the resampling algorithm is used to decide which particles to keep, straight from the log-weights if possible...
+		if self._get_indexes_from_log_weights is not None:
+
+			i_particles_to_be_kept = self._get_indexes_from_log_weights(normalized_log_weights)
+
+		# ...or otherwise from the (renormalized) weights
+		else:
+
+			if normalized_weights is None:
 
-				# ...and try again
-				i_particles_to_be_kept = self._resampling_algorithm.get_indexes(normalized_weights)
+				normalized_weights = self.weights_from_log_weights(normalized_log_weights)
 
-			# the above indexes are used to update the state
-			self._state = self._state[:, i_particles_to_be_kept]
+			i_particles_to_be_kept = self._resampling_algorithm.get_indexes(normalized_weights)
 
-			# note that if the weights have been normalized ("standard" centralized particle filter),
-			# then "self.aggregated_weight" is equal to 1
-			self._log_weights.fill(self._log_aggregated_weight - np.log(self._n_particles))
+		# the above indexes are used to update the state
+		self.set_state(self._state[:, i_particles_to_be_kept])
+
+		# note that if the weights have been normalized ("standard" centralized particle filter),
+		# then "self.aggregated_weight" is equal to 1
+		self._log_weights.fill(self._log_aggregated_weight - np.log(self._n_particles))
+		self._normalized_weights = None
+
+	def weights_from_log_weights(self, normalized_log_weights):
+
+		# the weights need to be converted to "natural" units (the largest log-weight is subtracted before exponentiating
+		# so that they don't all underflow to zero even if the log-weights are not exactly normalized); this is done in
+		# place, within the buffer
+		normalized_weights = np.subtract(
+			normalized_log_weights, normalized_log_weights.max(), out=self._weights_buffer)
+		np.exp(normalized_weights, out=normalized_weights)
+		normalized_weights /= normalized_weights.sum()
+
+		return normalized_weights
+
+	def set_state(self, value):
+
+		# if there is a buffer for the samples, they are copied into it...
+		if self._samples_buffer is not None:
+
+			np.copyto(self._samples_buffer, value)
+			self._state = self._samples_buffer
+
+		# ...and otherwise the new array is simply kept
+		else:
+
+			self._state = value
 
 	def get_particle(self, index):
 
@@ -163,7 +223,7 @@ class TargetTrackingParticleFilter(ParticleFilter):
 
 		if value.shape == self._state.shape:
 
-			self._state = value
+			self.set_state(value)
 
 		else:
 
@@ -187,17 +247,30 @@ class TargetTrackingParticleFilter(ParticleFilter):
 		# the aggregated weight is simply the sum of the non-normalized weights
 		self._log_aggregated_weight = smc_tools.util.log_sum_from_individual_logs(self._log_weights)
 
-	def compute_mean(self):
+		# this is called whenever the weights change, and hence the normalized ones must be recomputed
+		self._normalized_weights = None
+
+	def compute_mean(self, out=None):
+
+		# the normalized weights are computed in place, within the buffer
+		normalized_weights = np.subtract(self._log_weights, self._log_aggregated_weight, out=self._weights_buffer)
+		np.exp(normalized_weights, out=normalized_weights)
 
-		normalized_log_weights = self._log_weights - self._log_aggregated_weight
+		# a new array is only allocated if no (contiguous) buffer is passed...
+		if out is None:
 
-		# element-wise multiplication of the state vectors and their correspondent weights,
-		# followed by addition => weighted mean
-		return (self._state*np.exp(normalized_log_weights)[np.newaxis, :]).sum(axis=1)[:, np.newaxis]
+			out = np.empty((self._state.shape[0], 1))
+
+		# ...into which the matrix-vector product of the state vectors and their correspondent weights (weighted mean)
+		# is written straight away
+		np.matmul(self._state, normalized_weights, out=out[:, 0])
+
+		return out
 
 	def normalize_weights(self):
 
 		self._log_weights -= self._log_aggregated_weight
+		self._normalized_weights = None
 
 		# we forced this above
 		self._log_aggregated_weight = 0.
@@ -207,6 +280,7 @@ class TargetTrackingParticleFilter(ParticleFilter):
 	def normalize_weights_and_update_aggregated(self):
 
 		self._log_weights -= smc_tools.util.log_sum_from_individual_logs(self._log_weights)
+		self._normalized_weights = None
 
 		# this is enforced above
 		self._log_aggregated_weight = 0.
@@ -229,23 +303,66 @@ class TargetTrackingParticleFilter(ParticleFilter):
 
 		if self._log_weights.shape == value.shape:
 
-			self._log_weights = value
+			self.set_log_weights(value)
 
 		else:
 
 			raise Exception('the number of weights does not match the number of particles')
 
+	@property
+	def _log_aggregated_weight(self):
+
+		return self._log_aggregated_weight_buffer[0]
+
+	@_log_aggregated_weight.setter
+	def _log_aggregated_weight(self, value):
+
+		self._log_aggregated_weight_buffer[0] = value
+
+	def set_log_weights(self, value):
+
+		# if there is a buffer for the log-weights, they are copied into it...
+		if self._log_weights_buffer is not None:
+
+			np.copyto(self._log_weights_buffer, value)
+
+		# ...and otherwise the new array is simply kept
+		else:
+
+			self._log_weights = value
+
+		self._normalized_weights = None
+
 	@property
 	def weights(self):
 
 		return np.exp(self._log_weights)
 
+	def discard_normalized_weights(self):
+
+		# this must be called whenever the log-weights are modified from outside (e.g., through a shared array)
+		self._normalized_weights = None
+
+	@property
+	def normalized_weights(self):
+
+		# the weights are only exponentiated again if they have changed since the last time they were requested
+		if self._normalized_weights is None:
+
+			# the largest log-weight is subtracted before exponentiating to avoid underflow
+			normalized_weights = np.exp(self._log_weights - self._log_weights.max())
+			normalized_weights /= normalized_weights.sum()
+
+			self._normalized_weights = normalized_weights
+
+		return self._normalized_weights
+
 	@weights.setter
 	def weights(self, value):
 
 		if self._log_weights.shape == value.shape:
 
-			self._log_weights = np.log(value)
+			self.set_log_weights(np.log(value))
 
 		else:
 
@@ -276,8 +393,9 @@ class EmbeddedTargetTrackingParticleFilter(TargetTrackingParticleFilter):
 	# NOTE: using np.close may yield quite different results
 	def avoid_weight_degeneracy(self):
 
-		# the normalized weights are used to resample
-		self.resample(self._log_weights - self._log_aggregated_weight)
+		# the normalized weights are used to resample (since the largest log-weight is subtracted anyway, there is no need
+		# to subtract the aggregated weight beforehand)
+		self.resample(self._log_weights)
 
 # =========================================================================================================
 
@@ -293,8 +411,8 @@ class TargetTrackingParticleFilterWithConsensusCapabilities(TargetTrackingPartic
 		# the noise covariance matrix is built from the individual variances of each sensor
 		self._noiseCovariance = np.diag([s.noise_var for s in sensors])
 
-		# the position of every sensor
-		self._sensorsPositions = np.hstack([s.position for s in sensors])
+		# the position of every sensor (already gathered by the sensors array)
+		self._sensorsPositions = self._sensors_array.positions
 
 		# M, R_p, r_a_tuples, r_a, r_d_tuples, r_d, rs_gamma
 
@@ -309,24 +427,21 @@ class TargetTrackingParticleFilterWithConsensusCapabilities(TargetTrackingPartic
 	def likelihood_mean(self, positions):
 
 		# each row gives the distances from a sensor to ALL the positions
-		distances = np.linalg.norm(positions[:, :, np.newaxis] - self._sensorsPositions[:, np.newaxis, :], axis=0).T
+		distances = np.linalg.norm(positions[:, np.newaxis, :] - self._sensorsPositions[:, :, np.newaxis], axis=0)
 
 		return np.vstack([s.likelihood_mean(d) for d, s in zip(distances, self._sensors)])
 
 	def step(self, observations):
 
-		# the exponents of the monomials and their associated coefficients are extracted from the "consensed" beta's
-		exponents = np.array(list(self.betaConsensus.keys()))
-		betas = np.array(list(self.betaConsensus.values()))
-
 		# for the sake of convenience
 		x = state.to_position(self._state)
 
-		# a matrix containing the monomials evaluated for the all the x's
-		phi = (x[:, :, np.newaxis]**exponents.T[:, np.newaxis, :]).prod(axis=0)
+		# a matrix containing the monomials evaluated for the all the x's (the "consensed" beta's are arranged in the
+		# same order as the exponents in "r_d")
+		phi = (x[:, :, np.newaxis]**self._r_d.T[:, np.newaxis, :]).prod(axis=0)
 
 		# the exponent of the Joint Likelihood Function (JLF) for every particle (x), as computed in this PE
-		S = (phi * betas[np.newaxis, :]).sum(axis=1)
+		S = phi @ self.betaConsensus
 
 		# S contains exponents...and hence subtracting a constant is tantamount to scaling the power (the JLF)
 		shifted_S = S - max(S)
@@ -388,20 +503,20 @@ class TargetTrackingParticleFilterWithConsensusCapabilities(TargetTrackingPartic
 		# this term is independent of the indices
 		b = self._noiseCovariance.dot(observations)
 
-		# a dictionary to store the beta component associated to every vector of indices
-		self.beta = {}
+		# an array to store the beta component associated to every vector of indices (in the order of "r_d_tuples")
+		self.beta = np.empty(len(self._r_d_tuples))
 
-		for r in self._r_d_tuples:
+		for i_r, r in enumerate(self._r_d_tuples):
 
 			deg = sum(r)
 
 			if deg <= self._R_p:
 
-				self.beta[r] = alpha[r].dot(b) - gamma[r]
+				self.beta[i_r] = alpha[r].dot(b) - gamma[r]
 
 			elif deg <= (2*self._R_p):
 
-				self.beta[r] = - gamma[r]
+				self.beta[i_r] = - gamma[r]
 
 			else:
 
@@ -471,10 +586,9 @@ class TargetTrackingGaussianParticleFilter(TargetTrackingParticleFilter):
 		# the particles are propagated with a *fake* RandomState that always returns 0's
 		predictions = self._state_transition_kernel.next_state(self._state, self._fake_random_state)
 
-		# for each sensor, we compute the likelihood of EVERY predicted particle (position)
-		predictions_likelihoods = np.array(
-			[sensor.likelihood(obs, state.to_position(predictions)) for sensor, obs in
-			 zip(self._sensors, observations)])
+		# for each sensor, we compute the likelihood of EVERY predicted particle (position) in the preallocated buffer
+		predictions_likelihoods = self._sensors_array.likelihood(
+			observations, state.to_position(predictions), out=self._likelihoods)
 
 		# + 1e-200 in order to avoid division by zero
 		predictions_likelihoods_product = predictions_likelihoods.prod(axis=0) + 1e-200
@@ -487,16 +601,14 @@ class TargetTrackingGaussianParticleFilter(TargetTrackingParticleFilter):
 		# every particle is updated (previous state is not stored...)
 		self._state = self._state_transition_kernel.next_state(self._state[:, i_particles_resampled])
 
-		# for each sensor, we compute the likelihood of EVERY particle (position)
-		likelihoods = np.array([
-				sensor.likelihood(obs, state.to_position(self._state))
-				for sensor, obs in zip(self._sensors, observations)
-				])
+		# for each sensor, we compute the likelihood of EVERY particle (position) in the preallocated buffer
+		likelihoods = self._sensors_array.likelihood(
+			observations, state.to_position(self._state), out=self._likelihoods)
 
 		# careful with floating point arithmetic issues
 		likelihoods += 1e-200
 
-		loglikelihoods = np.log(likelihoods)
+		loglikelihoods = np.log(likelihoods, out=likelihoods)
 
 		# for each particle, we compute the product of the likelihoods for all the sensors
 		loglikelihoods_product = loglikelihoods.sum(axis=0)
@@ -640,8 +752,7 @@ class TargetTrackingSetMembershipConstrainedParticleFilter(TargetTrackingParticl
 		oversampled_particles = self._state_transition_kernel.next_state(self._state[:, i_oversampled_particles])
 
 		# for each sensor, we compute the likelihood of EVERY particle (position)
-		likelihoods = np.prod([sensor.likelihood(obs, state.to_position(oversampled_particles))
-		                       for sensor, obs in zip(self._sensors, observations)], axis=0)
+		likelihoods = self._sensors_array.likelihood(observations, state.to_position(oversampled_particles)).prod(axis=0)
 
 		# in order to avoid dividing by zero
 		likelihoods += 1e-200
@@ -709,8 +820,7 @@ class TargetTrackingSetMembershipConstrainedParticleFilter(TargetTrackingParticl
 		# ...the resulting particles
 		self._state, self.norm_constants = self.rejection_sampling(self._state[:, i_sampled_particles])
 
-		likelihoods = np.prod([sensor.likelihood(obs, state.to_position(self._state))
-		                       for sensor, obs in zip(self._sensors, observations)], axis=0)
+		likelihoods = self._sensors_array.likelihood(observations, state.to_position(self._state)).prod(axis=0)
 
 		# in order to avoid numerical precision problems
 		likelihoods += 1e-200
@@ -755,8 +865,7 @@ class TargetTrackingSelectiveGossipParticleFilter(TargetTrackingParticleFilter):
 		auxiliar_state = self._state_transition_kernel.next_state(self._state)
 
 		# for each sensor, we compute the likelihood of EVERY particle (position)
-		likelihoods = np.array(
-			[sensor.likelihood(obs, state.to_position(auxiliar_state)) for sensor, obs in zip(self._sensors, observations)])
+		likelihoods = self._sensors_array.likelihood(observations, state.to_position(auxiliar_state))
 
 		# careful with floating point arithmetic issues
 		likelihoods += 1e-200
@@ -789,14 +898,14 @@ class TargetTrackingSelectiveGossipParticleFilter(TargetTrackingParticleFilter):
 
 		self._state = self._state_transition_kernel.next_state(resampled)
 
-		# for each sensor, we compute the likelihood of EVERY particle (position)
-		likelihoods = np.array(
-			[sensor.likelihood(obs, state.to_position(self._state)) for sensor, obs in zip(self._sensors, observations)])
+		# for each sensor, we compute the likelihood of EVERY particle (position) in the preallocated buffer
+		likelihoods = self._sensors_array.likelihood(
+			observations, state.to_position(self._state), out=self._likelihoods)
 
 		# careful with floating point arithmetic issues
 		likelihoods += 1e-200
 
-		loglikelihoods = np.log(likelihoods)
+		loglikelihoods = np.log(likelihoods, out=likelihoods)
 
 		# for each particle we store the product of the likelihoods for all the sensors multiplied by the number of PEs
 		self.gamma = self._n_PEs*loglikelihoods.sum(axis=0)
@@ -1,10 +1,13 @@
 import numpy as np
-import scipy.misc
+import scipy.special
 import itertools
+import concurrent.futures
 import abc
 import copy
 
 import smc.estimator
+import sensors_PEs_connector
+import state
 from .particle_filter import ParticleFilter
 from . import centralized
 
@@ -13,7 +16,7 @@ class TargetTrackingParticleFilter(ParticleFilter, metaclass=abc.ABCMeta):
 
 	def __init__(
 			self, n_PEs, n_particles_per_PE, resampling_algorithm, resampling_criterion, prior, state_transition_kernel,
-			sensors, each_PE_required_sensors, pf_initial_aggregated_weight=1.0):
+			sensors, each_PE_required_sensors, pf_initial_aggregated_weight=1.0, n_threads=1):
 
 		super().__init__(n_PEs * n_particles_per_PE, resampling_algorithm, resampling_criterion)
 
@@ -26,6 +29,22 @@ class TargetTrackingParticleFilter(ParticleFilter, metaclass=abc.ABCMeta):
 		# a list of lists, the first one containing the indices of the sensors "seen" by the first PE...and so on
 		self._each_PE_required_sensors = each_PE_required_sensors
 
+		# ...and the same in compressed sparse row format, so that the observations required by all the PEs can be
+		# gathered at once
+		self._required_sensors_indptr, self._required_sensors_indices = sensors_PEs_connector.connections_to_csr(
+			each_PE_required_sensors)
+
+		# if requested, the PEs take their steps concurrently (see "step"); notice that the PEs usually share pseudo
+		# random numbers generators, and hence the results are then not reproducible
+		self._thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) if n_threads > 1 else None
+
+		# the samples, log-weights and (log) aggregated weights of all the PEs, if they are kept together (see
+		# "PEs_buffers")
+		self._PEs_samples, self._PEs_log_weights, self._PEs_log_aggregated_weights = None, None, None
+
+		# every subclass sets the object responsible for the exchanges among the PEs
+		self.exchange_recipe = None
+
 	@property
 	def n_PEs(self):
 
@@ -48,50 +67,106 @@ class TargetTrackingParticleFilter(ParticleFilter, metaclass=abc.ABCMeta):
 
 	def step(self, observations):
 
-		# a step is taken in every PF (ideally, this would occur concurrently); notice that every PE always accesses the
-		# sensors it needs (whatever the cost in communication messages)
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		# a step is taken in every PF (concurrently if requested); notice that every PE always accesses the sensors it
+		# needs (whatever the cost in communication messages)
+		if self._thread_pool is None:
+
+			for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
-			# only the appropriate observations are passed to this PE
-			# NOTE: it is assumed that the order in which the observations are passed is the same as that of the sensors
-			# when building the PF
-			PE.step(observations[sensors_connections])
+				# only the appropriate observations are passed to this PE
+				# NOTE: it is assumed that the order in which the observations are passed is the same as that of the
+				# sensors when building the PF
+				PE.step(PE_observations)
+
+		else:
+
+			# every PE writes only into its own arrays (or its own blocks of the shared ones); the results are consumed
+			# so that any exception raised within a thread is propagated
+			list(self._thread_pool.map(
+				lambda PE_and_observations: PE_and_observations[0].step(PE_and_observations[1]),
+				zip(self._PEs, self.each_PE_observations(observations))))
 
 		# a new time instant has elapsed
 		self._n += 1
 
+	def close(self):
+
+		# the threads (if any) in which the PEs take their steps are shut down...
+		if self._thread_pool is not None:
+
+			self._thread_pool.shutdown()
+
+		# ...and so are any used by the exchange recipe
+		if self.exchange_recipe is not None:
+
+			self.exchange_recipe.close()
+
+	def each_PE_observations(self, observations):
+
+		# the observations required by all the PEs are picked with a single fancy index, and then split (into views)
+		return np.split(observations[self._required_sensors_indices], self._required_sensors_indptr[1:-1])
+
+	def PEs_buffers(self, n_particles_per_PE):
+
+		# the samples, log-weights and (log) aggregated weights of all the PEs are kept together...
+		self._PEs_samples = np.empty((state.n_elements, self._n_PEs * n_particles_per_PE))
+		self._PEs_log_weights = np.empty(self._n_PEs * n_particles_per_PE)
+		self._PEs_log_aggregated_weights = np.full(self._n_PEs, np.nan)
+
+		# ...and the i-th PE writes into the i-th block
+		return [dict(
+			samples_buffer=self._PEs_samples[:, i_PE * n_particles_per_PE:(i_PE + 1) * n_particles_per_PE],
+			log_weights_buffer=self._PEs_log_weights[i_PE * n_particles_per_PE:(i_PE + 1) * n_particles_per_PE],
+			log_aggregated_weight_buffer=self._PEs_log_aggregated_weights[i_PE:i_PE + 1]
+		) for i_PE in range(self._n_PEs)]
+
 	def get_state(self):
 
-		# the state from every PE is gathered together
+		# if the samples of all the PEs are already together, no copy is made...
+		if self._PEs_samples is not None:
+
+			return self._PEs_samples
+
+		# ...and otherwise the state from every PE is gathered together
 		return np.hstack([PE.samples for PE in self._PEs])
 
-	def messages_observations_propagation(self, PEs_topology, each_processing_element_connected_sensors):
+	def get_log_weights(self):
 
-		i_observation_to_i_processing_element = np.empty(self._n_sensors)
+		# if the log-weights of all the PEs are already together, no copy is made...
+		if self._PEs_log_weights is not None:
 
-		# in order to find out to which PE is associated each observation
-		for i_PE, i_sensors in enumerate(each_processing_element_connected_sensors):
+			return self._PEs_log_weights
 
-			for i in i_sensors:
+		# ...and otherwise the log-weights from every PE are gathered together
+		return np.concatenate([PE.log_weights for PE in self._PEs])
 
-				i_observation_to_i_processing_element[i] = i_PE
+	def messages_observations_propagation(self, PEs_topology, each_processing_element_connected_sensors):
 
-		# the distance in hops between each pair of PEs
-		distances = PEs_topology.distances_between_processing_elements
+		# the sensors actually connected to every PE in CSR format...
+		connected_indptr, connected_indices = sensors_PEs_connector.connections_to_csr(
+			each_processing_element_connected_sensors)
 
-		n_messages = 0
+		# ...are used to build a mask telling whether a PE is connected to a sensor (one row per PE)...
+		i_connected_PEs = np.repeat(np.arange(len(each_processing_element_connected_sensors)), np.diff(connected_indptr))
+		connected = np.zeros((self._n_PEs, self._n_sensors), dtype=bool)
+		connected[i_connected_PEs, connected_indices] = True
 
-		# we loop through the observations "required" by each PE
-		for i_PE, i_sensors in enumerate(self._each_PE_required_sensors):
+		# ...and to find out to which PE is associated each observation
+		i_observation_to_i_processing_element = np.empty(self._n_sensors, dtype=int)
+		i_observation_to_i_processing_element[connected_indices] = i_connected_PEs
+
+		# the distance in hops between each pair of PEs
+		distances = PEs_topology.distances_between_processing_elements
 
-			# for every observation required by the PE...
-			for i in i_sensors:
+		# every observation required by every PE, along with the latter...
+		i_PEs = np.repeat(np.arange(self._n_PEs), np.diff(self._required_sensors_indptr))
+		i_sensors = self._required_sensors_indices
 
-				# ...if it doesn't have access to it...
-				if i not in each_processing_element_connected_sensors[i_PE]:
+		# ...is, if the PE doesn't have access to it, sent from the corresponding PE
+		not_available = ~connected[i_PEs, i_sensors]
 
-					# ...it must be sent from the corresponding PE
-					n_messages += distances[i_PE, i_observation_to_i_processing_element[i]]
+		n_messages = distances[
+			i_PEs[not_available], i_observation_to_i_processing_element[i_sensors[not_available]]].sum()
 
 		return n_messages
 
@@ -142,7 +217,7 @@ class LikelihoodConsensusTargetTrackingParticleFilter(TargetTrackingParticleFilt
 		r_a = np.array(r_a_tuples)
 
 		# theoretical number of monomials in the approximation
-		R_a = scipy.misc.comb(R_p + M, R_p, exact=True)
+		R_a = scipy.special.comb(R_p + M, R_p, exact=True)
 
 		assert(R_a == len(r_a_tuples))
 
@@ -151,15 +226,18 @@ class LikelihoodConsensusTargetTrackingParticleFilter(TargetTrackingParticleFilt
 			lambda x: sum(x) > (2*R_p), itertools.product(range(2*R_p+1), repeat=M)))
 		r_d = np.array(self._r_d_tuples)
 
-		# we generate the *two* vectors of exponents (r' and r'' in the paper) jointly,
-		# and then drop those combinations that don't satisfy the required constraints
-		rs_gamma = [list(itertools.filterfalse(
-			lambda x:
-			not np.allclose((np.array(x)[:M] + x[M:]), r) or sum(x[:M]) > R_p or sum(x[M:]) > R_p,
-			itertools.product(range(R_p+1), repeat=2*M))) for r in r_d]
+		# we generate the *two* vectors of exponents (r' and r'' in the paper) jointly (one combination per row)...
+		r_pairs = np.array(list(itertools.product(range(R_p+1), repeat=2*M)))
+
+		# ...drop those combinations in which any of the vectors exceeds the degree of the polynomial...
+		r_pairs = r_pairs[(r_pairs[:, :M].sum(axis=1) <= R_p) & (r_pairs[:, M:].sum(axis=1) <= R_p)]
+
+		# ...and, for every "r", keep those combinations adding up to it (all in vectorized form)
+		r_pairs_sums = r_pairs[:, :M] + r_pairs[:, M:]
+		rs_gamma = [[tuple(x) for x in r_pairs[(r_pairs_sums == r).all(axis=1)].tolist()] for r in r_d]
 
 		# theoretically, this is the number of beta components that should result
-		N_c = scipy.misc.comb(2*R_p + M, 2*R_p, exact=True)
+		N_c = scipy.special.comb(2*R_p + M, 2*R_p, exact=True)
 
 		assert(N_c == len(self._r_d_tuples))
 
@@ -172,19 +250,19 @@ class LikelihoodConsensusTargetTrackingParticleFilter(TargetTrackingParticleFilt
 	def step(self, observations):
 
 		# each PE initializes its local state
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
-			PE.pre_consensus_step(observations[sensors_connections])
+			PE.pre_consensus_step(PE_observations)
 
 		# consensus
 		self.exchange_recipe.perform_exchange(self)
 
 		# a step is taken in every PF (ideally, this would occur concurrently)
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
 			# only the appropriate observations are passed to this PE. Note that it is assumed that the order in which
 			# the observations are passed is the same as that of the sensors when building the PF
-			PE.step(observations[sensors_connections])
+			PE.step(PE_observations)
 
 # =========================================================================================================
 
@@ -194,12 +272,12 @@ class TargetTrackingParticleFilterWithDRNA(TargetTrackingParticleFilter):
 	def __init__(
 			self, exchange_period, exchange_recipe, n_particles_per_PE, normalization_period,
 			resampling_algorithm, resampling_criterion, prior, state_transition_kernel, sensors,
-			each_PE_required_sensors):
+			each_PE_required_sensors, n_threads=1):
 
 		super().__init__(
 			exchange_recipe.n_processing_elements, n_particles_per_PE, resampling_algorithm,
 			resampling_criterion, prior, state_transition_kernel, sensors, each_PE_required_sensors,
-			pf_initial_aggregated_weight=1.0 / exchange_recipe.n_processing_elements)
+			pf_initial_aggregated_weight=1.0 / exchange_recipe.n_processing_elements, n_threads=n_threads)
 
 		# a exchange of particles among PEs will happen every...
 		self._exchange_period = exchange_period
@@ -212,11 +290,17 @@ class TargetTrackingParticleFilterWithDRNA(TargetTrackingParticleFilter):
 
 		self._estimator = smc.estimator.WeightedMean(self)
 
-		# the particle filters are built (each one associated with a different set of sensors)
+		# the (log) aggregated weight every PE is assigned when the weights are reset, and that of each one of its
+		# particles (they only depend on the number of PEs and particles, and hence they are computed once)
+		self._log_reset_aggregated_weight = -np.log(self._n_PEs)
+		self._log_reset_weight = self._log_reset_aggregated_weight - np.log(n_particles_per_PE)
+
+		# the particle filters are built (each one associated with a different set of sensors), all of them writing
+		# their samples and log-weights into shared arrays
 		self._PEs = [centralized.EmbeddedTargetTrackingParticleFilter(
 			n_particles_per_PE, resampling_algorithm, resampling_criterion, prior, state_transition_kernel,
-			[sensors[iSensor] for iSensor in connections], aggregated_weight=1.0 / exchange_recipe.n_processing_elements
-		) for connections in each_PE_required_sensors]
+			[sensors[iSensor] for iSensor in connections], aggregated_weight=1.0 / exchange_recipe.n_processing_elements,
+			**buffers) for connections, buffers in zip(each_PE_required_sensors, self.PEs_buffers(n_particles_per_PE))]
 
 	def step(self, observations):
 
@@ -225,18 +309,15 @@ class TargetTrackingParticleFilterWithDRNA(TargetTrackingParticleFilter):
 		# if it is exchanging particles time
 		if self._n % self._exchange_period == 0:
 
+			# the exchange recipe already updates the aggregated weight of every PE after the exchange
 			self.exchange_recipe.perform_exchange(self)
 
-			# after the exchange, the aggregated weight of every PE must be updated
-			for PE in self._PEs:
-
-				PE.update_aggregated_weight()
-
-		# needed to perform the normalization below
-		aggregated_weights_sum = self.aggregated_weights.sum()
+		# needed to perform the normalization below (it is obtained in log-space, straight from the log aggregated
+		# weights, without exponentiating all of them)
+		log_aggregated_weights_sum = scipy.special.logsumexp(self._PEs_log_aggregated_weights)
 
 		# if every aggregated weight is zero...
-		if np.isclose(aggregated_weights_sum, 0):
+		if np.isclose(np.exp(log_aggregated_weights_sum), 0):
 
 			# ...we reinitialize the weights for all the particles of all the PEs
 			self.reset_weights()
@@ -244,35 +325,37 @@ class TargetTrackingParticleFilterWithDRNA(TargetTrackingParticleFilter):
 			# ...and skip the normalization code below
 			return
 
-		# the aggregated weights must be normalized every now and then to avoid computer precision issues
-		if self._n % self._normalization_period == 0:
+		# the aggregated weights must be normalized every now and then to avoid computer precision issues (unless they
+		# already add up to one, in which case it would be a no-op pass over all the weights)
+		if self._n % self._normalization_period == 0 and not np.isclose(log_aggregated_weights_sum, 0):
 
-			# ...to scale all the weights within ALL the PEs
-			for PE in self._PEs:
-
-				PE.divide_weights(aggregated_weights_sum)
+			# ...to scale all the weights within ALL the PEs (the log-weights and aggregated weights of all of them are
+			# kept together, and hence this is done at once)
+			self._PEs_log_weights -= log_aggregated_weights_sum
+			self._PEs_log_aggregated_weights -= log_aggregated_weights_sum
 
 	@property
 	def aggregated_weights(self):
 
-		return np.array([PE.aggregated_weight for PE in self._PEs])
+		# every PE keeps its aggregated weight up to date in the shared array
+		return np.exp(self._PEs_log_aggregated_weights)
 
 	def reset_weights(self):
 
 		"""It sets every weight of every PE to the same value.
 		"""
 
-		# every PE will be assigned the same aggregated weight:
-		aggregated_weight = 1.0/self._n_PEs
+		# every PE will be assigned the same aggregated weight (the aggregated weights of all of them are kept
+		# together)...
+		self._PEs_log_aggregated_weights.fill(self._log_reset_aggregated_weight)
 
-		# for every PE in this DPF...
-		for PE in self._PEs:
+		# ...along with the individual weights within every PE (all of them have the same number of particles)
+		self._PEs_log_weights.fill(self._log_reset_weight)
 
-			# the aggregated weight is set...
-			PE.aggregated_weight = aggregated_weight
+		# the weights have been modified behind the back of the PEs
+		for PE in self._PEs:
 
-			# ...along with the individual weights within the PE
-			PE.log_weights = np.full(PE._n_particles, -np.log(self._n_PEs) - np.log(PE._n_particles))
+			PE.discard_normalized_weights()
 
 	def compute_mean(self):
 
@@ -292,20 +375,22 @@ class TargetTrackingParticleFilterWithMposterior(TargetTrackingParticleFilter):
 
 	def __init__(
 			self, exchange_recipe, n_particles_per_PE, resampling_algorithm, resampling_criterion,
-			prior, state_transition_kernel, sensors, each_PE_required_sensors, sharing_period):
+			prior, state_transition_kernel, sensors, each_PE_required_sensors, sharing_period, n_threads=1):
 
 		super().__init__(
 			exchange_recipe.n_processing_elements, n_particles_per_PE, resampling_algorithm,
-			resampling_criterion, prior, state_transition_kernel, sensors, each_PE_required_sensors)
+			resampling_criterion, prior, state_transition_kernel, sensors, each_PE_required_sensors,
+			n_threads=n_threads)
 
 		self._sharing_period = sharing_period
 		self.exchange_recipe = exchange_recipe
 
-		# the particle filters are built (each one associated with a different set of sensors)
+		# the particle filters are built (each one associated with a different set of sensors), all of them writing
+		# their samples and log-weights into shared arrays
 		self._PEs = [centralized.TargetTrackingParticleFilter(
 			n_particles_per_PE, resampling_algorithm, resampling_criterion, prior, state_transition_kernel,
-			[sensors[iSensor] for iSensor in connections]
-		) for connections in each_PE_required_sensors]
+			[sensors[iSensor] for iSensor in connections], **buffers
+		) for connections, buffers in zip(each_PE_required_sensors, self.PEs_buffers(n_particles_per_PE))]
 
 	def step(self, observations):
 
@@ -384,9 +469,9 @@ class TargetTrackingGaussianParticleFilter(TargetTrackingParticleFilter):
 
 		self.exchange_recipe.perform_exchange(self)
 
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
-			PE.actual_sampling(observations[sensors_connections])
+			PE.actual_sampling(PE_observations)
 
 
 # =========================================================================================================
@@ -423,9 +508,9 @@ class TargetTrackingSetMembershipConstrainedParticleFilter(TargetTrackingParticl
 
 		self.exchange_recipe.global_set_determination(self)
 
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
-			PE.actual_sampling_step(observations[sensors_connections])
+			PE.actual_sampling_step(PE_observations)
 
 		self.exchange_recipe.consensus_on_likelihood(self)
 
@@ -463,9 +548,9 @@ class TargetTrackingSelectiveGossipParticleFilter(TargetTrackingParticleFilter):
 		# selective gossip followed by max gossip *for the first-stage weights*
 		self.exchange_recipe.selective_and_max_gossip(self)
 
-		for PE, sensors_connections in zip(self._PEs, self._each_PE_required_sensors):
+		for PE, PE_observations in zip(self._PEs, self.each_PE_observations(observations)):
 
-			PE.actual_sampling_step(observations[sensors_connections])
+			PE.actual_sampling_step(PE_observations)
 
 		# np.array([PE.samples for PE in self._PEs])
 
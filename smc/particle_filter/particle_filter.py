@@ -30,4 +30,11 @@ class ParticleFilter(metaclass=abc.ABCMeta):
 	@property
 	def name(self):
 
-		return self._name
\ No newline at end of file
+		return self._name
+
+	def close(self):
+
+		"""It releases any resource (e.g., a thread pool) held by the particle filter.
+		"""
+
+		pass
\ No newline at end of file
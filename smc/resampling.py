@@ -0,0 +1,122 @@
+import abc
+
+import numpy as np
+
+
+class LogWeightsResamplingAlgorithm(metaclass=abc.ABCMeta):
+
+	@abc.abstractmethod
+	def get_indexes_from_log_weights(self, log_weights, n=None):
+
+		"""The indexes of the particles that are kept, obtained straight from the log-weights.
+		"""
+
+		pass
+
+
+class SystematicResamplingAlgorithm(LogWeightsResamplingAlgorithm):
+
+	def __init__(self, PRNG=np.random.RandomState()):
+
+		self._PRNG = PRNG
+
+	def get_indexes(self, weights, n=None):
+
+		"""Systematic resampling.
+
+		Parameters
+		----------
+		weights: numpy array
+			the weights of the particles (not necessarily normalized)
+		n: int, optional
+			the number of indexes to be drawn (by default, as many as weights)
+
+		Returns
+		-------
+		indexes: numpy array
+			The indexes of the particles that are kept.
+		"""
+
+		if n is None:
+
+			n = len(weights)
+
+		# "n" (sorted) positions in [0, 1)...
+		positions = self.positions(n)
+
+		# ...that are located in the (normalized) cumulative sum of the weights
+		cumulative_weights = np.cumsum(weights)
+		cumulative_weights /= cumulative_weights[-1]
+
+		return np.searchsorted(cumulative_weights, positions)
+
+	def get_indexes_from_log_weights(self, log_weights, n=None):
+
+		"""Systematic resampling from log-weights (without ever exponentiating them).
+
+		Parameters
+		----------
+		log_weights: numpy array
+			the log-weights of the particles (not necessarily normalized)
+		n: int, optional
+			the number of indexes to be drawn (by default, as many as weights)
+
+		Returns
+		-------
+		indexes: numpy array
+			The indexes of the particles that are kept.
+		"""
+
+		if n is None:
+
+			n = len(log_weights)
+
+		# the logarithm of the cumulative sum of the weights is computed in a numerically stable manner...
+		log_cumulative_weights = np.logaddexp.accumulate(log_weights)
+
+		# ...and the positions are located in it after being scaled by the sum of all the weights
+		return np.searchsorted(log_cumulative_weights, np.log(self.positions(n)) + log_cumulative_weights[-1])
+
+	def positions(self, n):
+
+		# a single uniform sample determines "n" equispaced positions in [0, 1)
+		return (np.arange(n) + self._PRNG.random_sample()) / n
+
+
+class StratifiedResamplingAlgorithm(SystematicResamplingAlgorithm):
+
+	def positions(self, n):
+
+		# an independent uniform sample within each one of the "n" equally sized strata of [0, 1)
+		return (np.arange(n) + self._PRNG.random_sample(n)) / n
+
+
+class LogWeightsResamplingCriterion(metaclass=abc.ABCMeta):
+
+	@abc.abstractmethod
+	def is_resampling_needed_from_log_weights(self, log_weights):
+
+		"""Whether resampling is needed, decided straight from the (not necessarily normalized) log-weights.
+		"""
+
+		pass
+
+
+class LogEffectiveSampleSizeResamplingCriterion(LogWeightsResamplingCriterion):
+
+	def __init__(self, resampling_ratio):
+
+		self._resampling_ratio = resampling_ratio
+
+	def is_resampling_needed(self, weights):
+
+		# the effective sample size of the (normalized) weights is compared with a fraction of the number of particles
+		return 1/np.dot(weights, weights) < self._resampling_ratio*len(weights)
+
+	def is_resampling_needed_from_log_weights(self, log_weights):
+
+		# the (log) effective sample size is computed straight from the (not necessarily normalized) log-weights, so
+		# that they don't need to be exponentiated unless resampling is actually carried out
+		log_effective_sample_size = 2*np.logaddexp.reduce(log_weights) - np.logaddexp.reduce(2*log_weights)
+
+		return log_effective_sample_size < np.log(self._resampling_ratio*len(log_weights))
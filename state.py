@@ -15,7 +15,7 @@ i_position = range(2)
 i_velocity = range(2, 4)
 
 
-def to_position(state):
+def to_position(state, out=None):
 	"""It extracts the position elements out of the state vector.
 	
 	The purpose is to encapsulate the state so that other modules/classes don't need to know about the structure of the
@@ -25,6 +25,8 @@ def to_position(state):
 	----------
 	state : array_like
 		The source array.
+	out : ndarray, optional
+		If given, the position is copied into this (preallocated) array, which is then returned.
 
 	Returns
 	-------
@@ -32,8 +34,14 @@ def to_position(state):
 		The position embedded in the state.
 
 	"""
-	
-	return state[0:2, :]
+
+	if out is None:
+
+		return state[0:2, :]
+
+	np.copyto(out, state[0:2, :])
+
+	return out
 
 
 def to_velocity(state):
@@ -180,12 +188,26 @@ class UnboundedTransitionKernel(TransitionKernel):
 
 		n = state.shape[1]
 
-		velocity = to_velocity(state) + PRNG.normal(0, math.sqrt(self._velocity_variance / 2), (2, n))
+		# all the noise is drawn at once: the first two rows are for the velocity and the last two for the position
+		# (the same pseudo random numbers as when drawing the former and then the latter)
+		noise = PRNG.standard_normal((4, n))
+		velocity_noise, position_noise = noise[:2], noise[2:]
+
+		# the new state is computed in place, block by block (no intermediate arrays need to be stacked)
+		new_state = np.empty((n_elements, n))
+		velocity, position = to_velocity(new_state), to_position(new_state)
+
+		np.multiply(velocity_noise, math.sqrt(self._velocity_variance / 2), out=velocity)
+		velocity += to_velocity(state)
+
+		# step to be taken is obtained from the velocity and a noise component...
+		np.multiply(velocity, self._step_duration, out=position)
+		position += np.multiply(position_noise, math.sqrt(self._noise_variance / 2), out=position_noise)
 
-		# step to be taken is obtained from the velocity and a noise component
-		step = velocity * self._step_duration + PRNG.normal(0, math.sqrt(self._noise_variance / 2), (2, n))
+		# ...and added to the previous position
+		position += to_position(state)
 
-		return np.vstack((to_position(state) + step, velocity))
+		return new_state
 
 
 class BouncingWithinRectangleTransitionKernel(UnboundedTransitionKernel):
@@ -232,7 +254,8 @@ class BouncingWithinRectangleTransitionKernel(UnboundedTransitionKernel):
 
 			if (i_invalid.size == 0) or (n_bounces==self._max_bounces):
 
-				return np.vstack((tentative_new_pos, velocity))
+				# both the position and the velocity are views of the state, which has been updated in place
+				return unbounded_state
 
 			# a vector joining the previous position and the corresponding corner (dimension 2 is associated with a corner)
 			position_to_corner = self._room.tr_tl_bl_br_corners[:, np.newaxis, :] - previous_pos[:, i_invalid, np.newaxis]